@@ -12,104 +12,400 @@ http://research.stlouisfed.org/fred2/
 '''
 
 import argparse
+import csv
+import gzip
 import logging
 import os
+import queue
 import sys
+import tempfile
+import threading
+import time
 import json
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 import numpy as np
-import pandas as pd
 import requests
 import seaborn as sns
-from matplotlib import pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 import datetime
-from giantbomb_api import api_key
+try:
+    from giantbomb_api import api_key
+except ImportError:
+    # No key file (see README), e.g. when running against the stub server
+    api_key = os.environ.get('GIANTBOMB_API_KEY')
 
 CPI_DATA_URL = 'http://research.stlouisfed.org/fred2/data/CPIAUCSL.txt'
+GIANTBOMB_URL = 'http://www.giantbomb.com/api'
+# Giantbomb answers 420 (or 429) once a key goes over its request limits.
+# Start at about one request per second and let the limiter probe upward.
+THROTTLE_STATUSES = (420, 429)
+GIANTBOMB_LIMITS = {'rate': 1.0, 'max_rate': 5.0, 'concurrency': 1,
+                    'max_concurrency': 8}
+GIANTBOMB_RETRIES = 5
+LIMITERS = {}
+LIMITERS_LOCK = threading.Lock()
 CPI_FILEPATH = os.path.join(os.path.dirname(__file__), 'CPIAUCSL.txt')
+DEFAULT_REGION = 'US'
 PLOT_FILE = 'myplot.png'
 CSV_FILE = 'full_data.csv'
 LIMIT = None
+# Bars drawn before generate_plot aggregates; figure size in inches
+PLOT_MAX_BARS = 60
+PLOT_SIZE = (16, 9)
+
+FredData = namedtuple('FredData', ['series', 'years', 'months', 'values'])
+
+
+def fred_lines(lines):
+    '''Normalizes raw FRED lines (str or bytes) for numpy: decodes bytes
+    and swaps FRED's lone '.' for missing observations with nan.'''
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('latin-1')
+        if ' .' in line:
+            line = ' '.join('nan' if token == '.' else token
+                            for token in line.split())
+        yield line
+
+
+def parse_fred(file):
+    '''Parses FRED text data from a file-like object or any iterable of
+    lines (str or bytes). Skips to the DATE header, then streams the
+    numeric block straight into numpy, so lines can be parsed as they
+    arrive. Returns FredData w/ one values column per series; missing
+    observations become NaN.'''
+    lines = fred_lines(file)
+    for line in lines:
+        if line.startswith("DATE"):
+            break
+    else:
+        raise ValueError("No DATE header found in FRED data.")
+    series = line.split()[1:]
+    dtype = [('date', 'U10')] + [(name, float) for name in series]
+    rows = np.loadtxt(lines, dtype=dtype, ndmin=1)
+    # Dates are fixed-width YYYY-MM-DD, so read the digits as code points
+    digits = np.ascontiguousarray(rows['date']).view(np.uint32)
+    digits = digits.reshape(-1, 10) - ord('0')
+    years = digits[:, :4].dot([1000, 100, 10, 1])
+    months = (digits[:, 5] * 10 + digits[:, 6]).astype(int)
+    values = np.column_stack([rows[name] for name in series])
+    return FredData(series, years, months, values)
+
+
+def tee_lines(stream, out=None, chunk_size=81920):
+    '''Yields lines from a binary stream as chunks arrive, copying the
+    raw bytes to out (if given) on the way through.'''
+    pending = b''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        if out is not None:
+            out.write(chunk)
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + b'\n'
+    if pending:
+        yield pending
 
 
 class CPIData(object):
     '''Abstraction of FRED CPI data. Stores only one value per year.'''
 
-    def __init__(self):
-        # each year as k:v pair
-        self.year_cpi = {}
+    def __init__(self, country="US"):
+        # yearly mean CPI as array, indexed by offset from first_year
+        self.year_cpi = None
         # remember yearspan in dataset in order to handle years beyond
         # that span
         self.last_year = None
         self.first_year = None
-        self.country = "US"
+        self.country = country
         self.current_year = datetime.datetime.now().year
 
     def __str__(self):
-        return ("CPI data for" + self.country + "from" + self.first_year +
-                "to" + self.last_year)
+        return "CPI data for {0} from {1} to {2}".format(
+            self.country, self.first_year, self.last_year)
 
-    def load_from_url(self, url, save_as_file=None):
+    def load_from_url(self, url, save_as_file=None, column=0):
         '''Loads data from a given url. Option to save externally.
-        After getting file this fn uses load_from_file internally.'''
-        data = requests.get(url, stream=True,
-                            headers={'Accept-Encoding': None}).raw
+        The download is parsed while it streams in; if save_as_file is
+        given, the same bytes are written to it on the way through.
+        save_as_file only appears once the whole download has parsed, so
+        an error page or a dropped connection never leaves a bad copy.'''
+        response = requests.get(url, stream=True,
+                                headers={'Accept-Encoding': None})
+        response.raise_for_status()
+        data = response.raw
         print("Got FRED CPI data.")
-        # writes to file if needed
-        if save_as_file is not None:
-            with open(save_as_file, "wb+") as out:
-                while True:
-                    buffer = data.read(81920)
-                    if not buffer:
-                        break
-                    out.write(buffer)
-            print("Wrote to file:", save_as_file)
-        return self.load_from_file(data)
-
-    def load_from_file(self, file):
-        '''Loads CPI data from given file-like object.'''
-        current_year = None
-        year_cpi = {}
-        data = []
-        dataline = False
-        for line in file:
-            if dataline:
-                data.append(line.rstrip().split())
-            if line.startswith("DATE"):
-                dataline = True
-        data = pd.DataFrame(data)
-        data.columns = ['date', 'cpi']
-        data['year'] = data.date.apply(lambda x: int(x.split('-')[0]))
-        data['cpi'] = data.cpi.astype(float)
-        self.first_year = data.year.min()
-        self.last_year = data.year.max()
-        groups = data.groupby('year')
-        self.year_cpi = groups.mean()
-        print("Loaded FRED CPI data from file:", file)
+        if save_as_file is None:
+            self.load_from_file(tee_lines(data), column)
+            print("Loaded FRED CPI data from url:", url)
+            return
+        fd, partial = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(save_as_file)),
+            prefix=os.path.basename(save_as_file) + '.', suffix='.part')
+        try:
+            with os.fdopen(fd, "wb") as out:
+                self.load_from_file(tee_lines(data, out), column)
+            os.replace(partial, save_as_file)
+        except BaseException:
+            os.remove(partial)
+            raise
+        print("Loaded FRED CPI data from url:", url)
+        print("Wrote to file:", save_as_file)
+
+    def load_from_file(self, file, column=0):
+        '''Loads CPI data from given file-like object. For multi-series
+        files, column picks which series to use.'''
+        fred = parse_fred(file)
+        cpi = fred.values[:, column]
+        known = ~np.isnan(cpi)
+        years = fred.years[known]
+        self.first_year = int(years.min())
+        self.last_year = int(years.max())
+        # Yearly mean CPI, indexed by (year - first_year)
+        offsets = years - self.first_year
+        totals = np.bincount(offsets, weights=cpi[known])
+        counts = np.bincount(offsets)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.year_cpi = totals / counts
+        # Streams and line iterators (see load_from_url) have no name
+        name = getattr(file, 'name', None)
+        if name is not None:
+            print("Loaded FRED CPI data from file:", name)
 
     def get_adjusted_price(self, price, year, current_year=None):
         '''Returns adjusted price from a given year compared to
         specified current year.'''
         # Use edge data if given year not in CPI dataset
-        if not current_year:
-            current_year = self.current_year
-        year = max(self.first_year, year)
-        year = min(self.last_year, year)
-        year_cpi = self.year_cpi.loc[year]['cpi']
-        current_cpi = self.year_cpi.loc[current_year]['cpi']
+        year = self.clamp_year(year)
+        current_year = self.clamp_year(current_year or self.current_year)
+        year_cpi = self.year_cpi[year - self.first_year]
+        current_cpi = self.year_cpi[current_year - self.first_year]
         return float(price) * current_cpi / year_cpi
 
+    def get_adjusted_prices(self, prices, years, current_year=None):
+        '''Vectorized get_adjusted_price. Takes sequences of prices and
+        years, returns an array of adjusted prices.'''
+        years = np.clip(np.asarray(years, dtype=int),
+                        self.first_year, self.last_year)
+        current_year = self.clamp_year(current_year or self.current_year)
+        current_cpi = self.year_cpi[current_year - self.first_year]
+        year_cpi = self.year_cpi[years - self.first_year]
+        return np.asarray(prices, dtype=float) * current_cpi / year_cpi
+
+    def clamp_year(self, year):
+        '''Pins a year to the span covered by the dataset.'''
+        return min(self.last_year, max(self.first_year, year))
+
+
+class CPIRegistry(object):
+    '''Holds FRED CPI series for many regions. Each series is registered
+    w/ a local file (and optional download url) and only parsed the first
+    time it is used; parsed CPIData objects are memoized.'''
+
+    def __init__(self):
+        self.sources = {}
+        self.loaded = {}
+
+    def register(self, region, filepath, url=None, column=0):
+        '''Adds a series for region. column picks the series in
+        multi-series FRED files.'''
+        self.sources[region] = (filepath, url, column)
+        self.loaded.pop(region, None)
+
+    def get(self, region):
+        '''Returns CPIData for region, loading it on first use.'''
+        if region in self.loaded:
+            return self.loaded[region]
+        if region not in self.sources:
+            raise KeyError("No CPI series registered for " + region)
+        filepath, url, column = self.sources[region]
+        cpi_data = CPIData(country=region)
+        if os.path.exists(filepath):
+            print("Pulling CPI data from file")
+            with open(filepath) as fp:
+                cpi_data.load_from_file(fp, column)
+        elif url is not None:
+            print("Downloading CPI data.")
+            cpi_data.load_from_url(url, save_as_file=filepath, column=column)
+        else:
+            raise IOError("No CPI data found at " + filepath)
+        self.loaded[region] = cpi_data
+        return cpi_data
+
+    def adjust_prices(self, prices, years, regions, current_year=None):
+        '''Adjusts a batch of prices, each w/ its own release year and
+        region. Does one vectorized pass per distinct region.'''
+        prices = np.asarray(prices, dtype=float)
+        years = np.asarray(years, dtype=int)
+        regions = np.asarray(regions)
+        adjusted = np.empty_like(prices)
+        for region in np.unique(regions):
+            mask = regions == region
+            adjusted[mask] = self.get(region).get_adjusted_prices(
+                prices[mask], years[mask], current_year)
+        return adjusted
+
+
+class RateLimiter(object):
+    '''Client-side throttle for an API key: a token bucket (rate requests
+    per second, up to burst at once) plus a cap on requests in flight.
+    Both adapt AIMD-style: every good response nudges them up (rate by
+    rate_step, concurrency by 1/concurrency), while a throttle response
+    (420/429), or a response slower than target_latency, cuts them. A
+    Retry-After header pauses all callers. Thread-safe; share one per key.'''
+
+    def __init__(self, rate=1.0, max_rate=None, burst=1, rate_step=0.1,
+                 concurrency=1, max_concurrency=8, target_latency=None,
+                 min_rate=0.05):
+        self.rate = float(rate)
+        self.max_rate = float(max_rate or rate)
+        self.min_rate = min_rate
+        self.rate_step = rate_step
+        self.burst = burst
+        self.tokens = float(burst)
+        self.concurrency = float(concurrency)
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.updated = time.monotonic()
+        self.cond = threading.Condition()
+        self.stats = {'requests': 0, 'throttled': 0, 'slow': 0,
+                      'wait_seconds': 0.0}
+
+    def acquire(self):
+        '''Blocks until a request may be sent.'''
+        start = time.monotonic()
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens +
+                                  (now - self.updated) * self.rate)
+                self.updated = now
+                waits = []
+                if now < self.paused_until:
+                    waits.append(self.paused_until - now)
+                if self.tokens < 1:
+                    waits.append((1 - self.tokens) / self.rate)
+                if not waits and self.in_flight < int(self.concurrency):
+                    break
+                # Blocked on concurrency alone means waiting for release()
+                self.cond.wait(max(waits) if waits else None)
+            self.tokens -= 1
+            self.in_flight += 1
+            self.stats['requests'] += 1
+            self.stats['wait_seconds'] += time.monotonic() - start
+
+    def release(self, latency, throttled=False, retry_after=None,
+                failed=False):
+        '''Reports how the request went and adapts the limits. Failed
+        requests (no response) free their slot without adapting.'''
+        with self.cond:
+            self.in_flight -= 1
+            if failed:
+                pass
+            elif throttled:
+                self.stats['throttled'] += 1
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.concurrency = max(1.0, self.concurrency / 2)
+                if retry_after:
+                    self.paused_until = time.monotonic() + retry_after
+            elif self.target_latency and latency > self.target_latency:
+                self.stats['slow'] += 1
+                self.concurrency = max(1.0, self.concurrency * 0.75)
+            else:
+                self.rate = min(self.max_rate, self.rate + self.rate_step)
+                self.concurrency = min(self.max_concurrency,
+                                       self.concurrency +
+                                       1 / self.concurrency)
+            self.cond.notify_all()
+
+    def metrics(self):
+        '''Returns counters plus the current adapted limits.'''
+        with self.cond:
+            return dict(self.stats, rate=self.rate,
+                        concurrency=self.concurrency)
+
+
+def shared_limiter(api_key):
+    '''Returns the RateLimiter for api_key, creating it on first use, so
+    every GiantbombAPI on the same key draws from one budget.'''
+    with LIMITERS_LOCK:
+        if api_key not in LIMITERS:
+            LIMITERS[api_key] = RateLimiter(**GIANTBOMB_LIMITS)
+        return LIMITERS[api_key]
+
 
 class GiantbombAPI(object):
-    '''Simple implementation of Giantbomb API that only offers the GET
-    /platforms/ call as a generator.'''
+    '''Simple implementation of Giantbomb API. Any list resource
+    (/platforms/, /games/, /releases/, ...) can be paged through as a
+    generator w/ get_resource or get_resource_pages.'''
 
-    def __init__(self, api_key):
+    def __init__(self, api_key, base_url=GIANTBOMB_URL, limiter=None):
         self.api_key = api_key
-        self.base_url = "http://www.giantbomb.com/api"
-
-    def get_platforms(self, sort=None, filter=None, field_list=None):
+        self.base_url = base_url
+        self.limiter = limiter or shared_limiter(api_key)
+        # Reuse connections across page requests
+        self.session = requests.Session()
+        self.session.headers['user-agent'] = 'Chess-Api'
+
+    def get_platforms(self, sort=None, filter=None, field_list=None,
+                      concurrency=1):
         '''Generator for platforms matching criteria. If none passed,
         returns **all** platforms.'''
+        for row in self.get_resource('platforms', sort, filter, field_list,
+                                     concurrency, clean_platforms):
+            yield row
+        print("Retrieved platform dataset.")
+
+    def get_platform_pages(self, sort=None, filter=None, field_list=None,
+                           concurrency=1):
+        '''Generator for whole result pages of platforms matching criteria.
+        Yields (rows, number of total results) per API call.'''
+        return self.get_resource_pages('platforms', sort, filter, field_list,
+                                       concurrency, clean_platforms)
+
+    def get_games(self, sort=None, filter=None, field_list=None,
+                  concurrency=1):
+        '''Generator for games matching criteria.'''
+        return self.get_resource('games', sort, filter, field_list,
+                                 concurrency)
+
+    def get_releases(self, sort=None, filter=None, field_list=None,
+                     concurrency=1):
+        '''Generator for (regional) game releases matching criteria.'''
+        return self.get_resource('releases', sort, filter, field_list,
+                                 concurrency)
+
+    def get_resource(self, resource, sort=None, filter=None, field_list=None,
+                     concurrency=1, clean=None):
+        '''Generator for rows of any list resource. Rows are handed on a
+        page at a time, w/o per-row work beyond clean (if given).'''
+        counter = 0
+        for page, num_total in self.get_resource_pages(
+                resource, sort, filter, field_list, concurrency, clean):
+            counter += len(page)
+            msg = "Yielding {0} {1} of {2}"
+            logging.debug(msg.format(resource, counter, num_total))
+            # Implement as a generator
+            yield from page
+
+    def get_resource_pages(self, resource, sort=None, filter=None,
+                           field_list=None, concurrency=1, clean=None):
+        '''Generator for whole result pages of a list resource matching
+        criteria. Yields (rows, number of total results) per API call.
+        field_list limits the fields the API sends back, which keeps the
+        large resources cheap to transfer and decode. clean is applied to
+        each page of rows. With concurrency > 1, the pages after the first
+        (whose offsets are known once it reports the total) are fetched
+        that many at a time; pages are still yielded in order.'''
+        path = '/{0}/'.format(resource)
         # Set up params dict for API call
         params = {}
         if sort:
@@ -121,32 +417,69 @@ class GiantbombAPI(object):
             params['filter'] = ','.join(parsed_filter)
         params['api_key'] = self.api_key
         params['format'] = 'json'
-        headers = {'user-agent': 'Chess-Api'}
-        # Set up for getting full result set
-        incomplete = True
-        num_total = None
-        num_returned = 0
-        counter = 0
-        while incomplete:
-            # GiantbombAPI has page limit = 100
-            params['offset'] = num_returned
-            resp = requests.get(self.base_url + '/platforms/', params=params,
-                                headers=headers)
-            result = resp.json()
-            if not num_total:
-                num_total = int(result['number_of_total_results'])
-            num_returned += int(result['number_of_page_results'])
-            if num_returned >= num_total:
-                incomplete = False
-            for row in result['results']:
-                msg = "Yielding platform {0} of {1}"
-                logging.debug(msg.format(counter + 1, num_total))
-                if 'original_price' in row and row['original_price']:
-                    row['original_price'] = float(row['original_price'])
-                # Implement as a generator
-                yield row
-                counter += 1
-        print("Retrieved platform dataset.")
+        clean = clean or (lambda rows: rows)
+        # GiantbombAPI has page limit = 100
+        result = self.get_page(path, params, 0)
+        num_total = int(result['number_of_total_results'])
+        page_size = int(result['number_of_page_results'])
+        yield clean(result['results']), num_total
+        if not page_size:
+            return
+        if concurrency <= 1:
+            # Set up for getting full result set
+            num_returned = page_size
+            while num_returned < num_total:
+                result = self.get_page(path, params, num_returned)
+                num_page = int(result['number_of_page_results'])
+                if not num_page:
+                    break
+                num_returned += num_page
+                yield clean(result['results']), num_total
+            return
+        offsets = iter(range(page_size, num_total, page_size))
+        with ThreadPoolExecutor(concurrency) as pool:
+            # Keep a bounded window of requests in flight
+            pending = deque(pool.submit(self.get_page, path, params, offset)
+                            for offset in islice(offsets, concurrency * 2))
+            while pending:
+                result = pending.popleft().result()
+                for offset in islice(offsets, 1):
+                    pending.append(pool.submit(self.get_page, path, params,
+                                               offset))
+                yield clean(result['results']), num_total
+
+    def get_page(self, path, params, offset, retries=GIANTBOMB_RETRIES):
+        '''Fetches one page of results at offset through the rate limiter,
+        retrying throttled requests. Returns parsed JSON.'''
+        for attempt in range(retries + 1):
+            self.limiter.acquire()
+            start = time.monotonic()
+            try:
+                resp = self.session.get(self.base_url + path,
+                                        params=dict(params, offset=offset))
+            except requests.RequestException:
+                self.limiter.release(time.monotonic() - start, failed=True)
+                raise
+            throttled = resp.status_code in THROTTLE_STATUSES
+            retry_after = resp.headers.get('Retry-After', '')
+            self.limiter.release(time.monotonic() - start, throttled,
+                                 float(retry_after) if retry_after.isdigit()
+                                 else None)
+            if throttled:
+                logging.warning(u"Throttled by Giantbomb ({0}).".format(
+                    resp.status_code))
+            if not throttled or attempt == retries:
+                break
+        resp.raise_for_status()
+        return resp.json()
+
+
+def clean_platforms(rows):
+    '''Converts platform prices in a page of API results to floats.'''
+    for row in rows:
+        if 'original_price' in row and row['original_price']:
+            row['original_price'] = float(row['original_price'])
+    return rows
 
 
 def is_valid_dataset(platform):
@@ -167,44 +500,295 @@ def is_valid_dataset(platform):
     return True
 
 
-def generate_plot(platforms, outfile):
-    '''Generates PNG bar chart of platforms.'''
-    labels = []
-    values = []
-    for platform in platforms:
-        name = platform['abbreviation']
-        adj_price = platform['adjusted_price']
-        price = platform['original_price']
-        # Remove outlier prices > $2000 for ease of Viz
-        if price > 2000:
-            continue
-        label = u"{0} ${1}".format(name, price, round(adj_price, 2))
-        labels.insert(0, label)
-        values.insert(0, adj_price)
+CSV_HEADERS = ['Abbreviations', 'Name', 'Year', 'Price', 'Adjusted Price']
+PLATFORM_FIELDS = [('abbreviation', object), ('name', object),
+                   ('year', np.int32), ('original_price', np.float64),
+                   ('adjusted_price', np.float64)]
+
+
+class PlatformDataset(object):
+    '''Columnar platform data w/ a fixed schema (PLATFORM_FIELDS). Each
+    column is a preallocated numpy array that doubles when full, so rows
+    can be appended as they come out of the pipeline in amortized O(1).'''
+
+    def __init__(self, capacity=128):
+        self.size = 0
+        self.capacity = capacity
+        self.columns = {name: np.empty(capacity, dtype)
+                        for name, dtype in PLATFORM_FIELDS}
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, name):
+        '''Returns a view of the filled part of a column.'''
+        return self.columns[name][:self.size]
+
+    def append(self, platform):
+        '''Copies the schema fields of a platform dict into the columns.'''
+        if self.size == self.capacity:
+            self.grow()
+        for name, _ in PLATFORM_FIELDS:
+            self.columns[name][self.size] = platform[name]
+        self.size += 1
+
+    def grow(self):
+        self.capacity *= 2
+        for name, column in self.columns.items():
+            grown = np.empty(self.capacity, column.dtype)
+            grown[:self.size] = column[:self.size]
+            self.columns[name] = grown
+
+    def rows(self):
+        '''Iterates over rows as tuples in PLATFORM_FIELDS order.'''
+        return zip(*[self[name] for name, _ in PLATFORM_FIELDS])
+
+
+class StageError(object):
+    '''Carries an exception from a pipeline stage thread downstream.'''
+
+    def __init__(self, exc):
+        self.exc = exc
+
+
+class PlatformPipeline(object):
+    '''Staged producer/consumer pipeline for platform data:
+    fetch pages -> validate -> enrich. Fetching and validation run in their
+    own threads, connected by bounded queues, so network paging overlaps
+    with the work downstream. Enrichment adjusts prices per page in one
+    batch and runs any extra per-platform lookups (enrichers) on a worker
+    pool. Pages come out in API order.'''
+
+    def __init__(self, gb_api, cpi_registry, enrichers=(), workers=4,
+                 queue_size=4):
+        self.gb_api = gb_api
+        self.cpi_registry = cpi_registry
+        # callables taking a platform dict; they update it in place
+        self.enrichers = list(enrichers)
+        self.workers = workers
+        self.queue_size = queue_size
+        self.stopped = threading.Event()
+
+    def run(self, limit=None, **query):
+        '''Generator for enriched, valid platforms. query is passed on to
+        GiantbombAPI.get_platform_pages.'''
+        self.stopped.clear()
+        fetched = queue.Queue(self.queue_size)
+        validated = queue.Queue(self.queue_size)
+        stages = [
+            threading.Thread(target=self.fetch, args=(fetched, query)),
+            threading.Thread(target=self.validate, args=(fetched, validated)),
+        ]
+        for stage in stages:
+            stage.daemon = True
+            stage.start()
+        counter = 0
+        pool = ThreadPoolExecutor(self.workers) if self.enrichers else None
+        try:
+            while True:
+                page = self.get(validated, stages)
+                if page is None:
+                    break
+                if isinstance(page, StageError):
+                    raise page.exc
+                for platform in self.enrich(page, pool):
+                    yield platform
+                    counter += 1
+                    # Limit resultset here since we can't on the API level
+                    if limit is not None and counter >= limit:
+                        return
+        finally:
+            self.stopped.set()
+            if pool is not None:
+                pool.shutdown()
+
+    def put(self, outbox, item):
+        '''Blocking put that gives up once the pipeline is stopped.'''
+        while not self.stopped.is_set():
+            try:
+                outbox.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, inbox, producers=()):
+        '''Blocking get that returns None once the pipeline is stopped.
+        If the producer threads have all died w/o a last item, returns a
+        StageError rather than waiting forever.'''
+        while not self.stopped.is_set():
+            try:
+                return inbox.get(timeout=0.1)
+            except queue.Empty:
+                pass
+            if producers and not any(p.is_alive() for p in producers):
+                try:
+                    return inbox.get_nowait()
+                except queue.Empty:
+                    return StageError(RuntimeError(
+                        "Pipeline stage exited w/o finishing"))
+        return None
+
+    def fetch(self, outbox, query):
+        '''Stage 1: pulls result pages from Giantbomb.'''
+        try:
+            for page, _ in self.gb_api.get_platform_pages(**query):
+                if not self.put(outbox, page):
+                    return
+        except Exception as exc:
+            self.put(outbox, StageError(exc))
+            return
+        self.put(outbox, None)
+
+    def validate(self, inbox, outbox):
+        '''Stage 2: drops incomplete platforms and parses release years.'''
+        try:
+            while True:
+                page = self.get(inbox)
+                if page is None or isinstance(page, StageError):
+                    self.put(outbox, page)
+                    return
+                valid = []
+                for platform in page:
+                    # Skip platforms without release date and/or price
+                    if not is_valid_dataset(platform):
+                        continue
+                    platform['year'] = int(
+                        platform['release_date'].split('-')[0])
+                    platform.setdefault('region', DEFAULT_REGION)
+                    valid.append(platform)
+                if not self.put(outbox, valid):
+                    return
+        except Exception as exc:
+            self.put(outbox, StageError(exc))
+
+    def enrich(self, page, pool):
+        '''Stage 3: adjusts prices for a page of platforms, per region,
+        then applies enrichers on the worker pool.'''
+        if not page:
+            return page
+        adjusted = self.cpi_registry.adjust_prices(
+            [platform['original_price'] for platform in page],
+            [platform['year'] for platform in page],
+            [platform['region'] for platform in page])
+        for platform, adjusted_price in zip(page, adjusted):
+            platform['adjusted_price'] = float(adjusted_price)
+        for enricher in self.enrichers:
+            # list() surfaces exceptions raised by the workers
+            list(pool.map(enricher, page))
+        return page
+
+
+def generate_plot(platforms, outfile, max_bars=PLOT_MAX_BARS, mode='auto'):
+    '''Generates PNG bar chart of platforms. Takes a PlatformDataset.
+    Draws one bar per platform up to max_bars; past that, mode 'year'
+    averages adjusted prices per release year and mode 'top' keeps the
+    max_bars priciest platforms ('auto' picks year buckets if they fit).
+    Renders w/ the Agg canvas at a fixed size, so cost stays flat.'''
+    prices = platforms['original_price']
+    # Remove outlier prices > $2000 for ease of Viz
+    keep = prices <= 2000
+    names = platforms['abbreviation'][keep]
+    years = platforms['year'][keep]
+    prices = prices[keep]
+    values = platforms['adjusted_price'][keep]
+    if mode == 'auto':
+        if len(values) <= max_bars:
+            mode = 'platform'
+        elif len(np.unique(years)) <= max_bars:
+            mode = 'year'
+        else:
+            mode = 'top'
+    if mode == 'year':
+        first_year = years.min()
+        counts = np.bincount(years - first_year)
+        totals = np.bincount(years - first_year, weights=values)
+        offsets = np.flatnonzero(counts)
+        values = totals[offsets] / counts[offsets]
+        labels = [u"{0} (n={1})".format(first_year + offset, counts[offset])
+                  for offset in offsets]
+        xlabel = 'Year (mean of platforms)'
+    else:
+        if mode == 'top':
+            top = np.argsort(values, kind='stable')[::-1][:max_bars]
+            names, years = names[top], years[top]
+            prices, values = prices[top], values[top]
+        # Oldest first
+        order = np.argsort(years, kind='stable')
+        names, prices, values = names[order], prices[order], values[order]
+        labels = [u"{0} ${1}".format(name, price)
+                  for name, price in zip(names, prices)]
+        xlabel = 'Year / Console'
     width = 0.3
     ind = np.arange(len(values))
-    fig = plt.figure(figsize=(len(labels), 10))
+    fig = Figure(figsize=PLOT_SIZE)
+    FigureCanvasAgg(fig)
     ax = fig.add_subplot(1, 1, 1)
     ax.bar(ind, values, width, align='center')
     # Granular formatting/icing
-    plt.ylabel('Adjusted Price')
-    plt.xlabel('Year / Console')
-    ax.set_xticks(ind + 0.3)
-    ax.set_xticklabels(labels)
-    fig.autofmt_xdate()
-    plt.grid(True)
-    # Save plot to file and display it
-    plt.savefig(outfile)
-    plt.clf()
+    ax.set_ylabel('Adjusted Price')
+    ax.set_xlabel(xlabel)
+    ax.set_xticks(ind)
+    ax.set_xticklabels(labels, rotation=60, ha='right', fontsize='small')
+    ax.grid(True)
+    fig.tight_layout()
+    # Save plot to file
+    fig.savefig(outfile)
     print("Generated bar plot at file:", outfile)
 
 
-def generate_csv(platforms, outpath):
-    '''Writes dataset to CSV file. Takes dict list and filepath/file obj.'''
-    headers = ['Abbreviations', 'Name', 'Year', 'Price', 'Adjusted Price']
-    dataset = pd.DataFrame(platforms)
-    dataset.to_csv(outpath)
-    print("Generated csv of full dataset at file:", outpath)
+class PlatformCSVWriter(object):
+    '''Streams platforms to CSV one row at a time, e.g. straight out of
+    the pipeline. Writes CSV_HEADERS, then PLATFORM_FIELDS per row. Takes a
+    filepath (gzipped if compress, or if it ends w/ .gz) or file obj.
+    Flushes every flush_every rows so the file is usable mid-fetch.'''
+
+    def __init__(self, outpath, compress=None, flush_every=100):
+        self.outpath = outpath
+        self.owned = isinstance(outpath, str)
+        if compress is None:
+            compress = self.owned and outpath.endswith('.gz')
+        if not self.owned:
+            self.out = outpath
+        elif compress:
+            self.out = gzip.open(outpath, 'wt', newline='')
+        else:
+            self.out = open(outpath, 'w', newline='')
+        self.flush_every = flush_every
+        self.count = 0
+        self.writer = csv.writer(self.out)
+        self.writer.writerow(CSV_HEADERS)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, platform):
+        '''Writes the schema fields of a platform dict.'''
+        self.writerow([platform[name] for name, _ in PLATFORM_FIELDS])
+
+    def writerow(self, row):
+        self.writer.writerow(row)
+        self.count += 1
+        if self.count % self.flush_every == 0:
+            self.out.flush()
+
+    def close(self):
+        if self.owned:
+            self.out.close()
+        else:
+            self.out.flush()
+        print("Generated csv of full dataset at file:", self.outpath)
+
+
+def generate_csv(platforms, outpath, compress=None):
+    '''Writes dataset to CSV file. Takes PlatformDataset and filepath/file
+    obj.'''
+    with PlatformCSVWriter(outpath, compress) as writer:
+        for row in platforms.rows():
+            writer.writerow(row)
 
 
 def parse_args():
@@ -235,67 +819,59 @@ def parse_args():
     return opts
 
 
-def main():
-    '''Contains the main logic for the script.'''
+def main(api_key=api_key, base_url=GIANTBOMB_URL, cpi_data_url=CPI_DATA_URL,
+         cpi_file=CPI_FILEPATH, plot_file=PLOT_FILE, csv_file=CSV_FILE,
+         limit=LIMIT, concurrency=1, limiter=None):
+    '''Contains the main logic for the script. Defaults to the module
+    constants; override them to e.g. point at the offline stub server.'''
     # Grab CPI/Inflation data.
-    cpi_data = CPIData()
+    cpi_registry = CPIRegistry()
+    cpi_registry.register(DEFAULT_REGION, cpi_file, url=cpi_data_url)
     # Grab API/game platform data.
-    gb_api = GiantbombAPI(api_key)
+    gb_api = GiantbombAPI(api_key, base_url, limiter)
 
     disclaimer = '''
     Disclaimer: This script uses data provided by FRED (Federal
     Reserve Economic Data) from the Federal Reserve Bank of St. Louis and
     Giantbomb.com:\n- {0}\n- http://www.giantbomb.com/api/\n'''.format(
-        CPI_DATA_URL)
+        cpi_data_url)
 
     print(disclaimer)
 
-    if os.path.exists(CPI_FILEPATH):
-        print("Pulling CPI data from file")
-        with open(CPI_FILEPATH) as fp:
-            cpi_data.load_from_file(fp)
-
-    else:
-        print("Downloading CPI data.")
-        cpi_data.load_from_url(CPI_DATA_URL, save_as_file=CPI_FILEPATH)
-
     # Figure out the current price of each platform.
-    # This will require looping through each game platform we received,
-    # and calculate the adjusted price based on the CPI data we also
-    # received. During this point, we should also validate our data so
-    # we do not skew our results.
-    platforms = []
+    # The pipeline validates each game platform we receive as pages
+    # arrive, so we do not skew our results, then calculates the adjusted
+    # price based on the CPI data (loaded on first use) per region.
+    pipeline = PlatformPipeline(gb_api, cpi_registry)
+    # Only hold on to the full dataset if we need it for the plot; the
+    # CSV file is written row by row as platforms come in.
+    platforms = PlatformDataset() if plot_file else None
+    csv_writer = PlatformCSVWriter(csv_file) if csv_file else None
     counter = 0
-
-    # Now that we have both data sources set up, fetch the platforms and
-    # calculate their current price via the CPI value ratio.
-    for platform in gb_api.get_platforms(sort='release_date:desc',
-                                         field_list=['release_date',
-                                                     'original_price',
-                                                     'name',
-                                                     'abbreviation']):
-        # Skip platforms without release date and/or price
-        if not is_valid_dataset(platform):
-            continue
-        year = int(platform['release_date'].split('-')[0])
-        price = platform['original_price']
-        adjusted_price = cpi_data.get_adjusted_price(price, year)
-        platform['year'] = year
-        platform['original_price'] = price
-        platform['adjusted_price'] = adjusted_price
-        platforms.append(platform)
-        # Limit resultset here since we can't on the API level
-        if LIMIT is not None and counter + 1 >= LIMIT:
-            break
-        counter += 1
+    try:
+        for platform in pipeline.run(limit=limit,
+                                     sort='release_date:desc',
+                                     field_list=['release_date',
+                                                 'original_price',
+                                                 'name',
+                                                 'abbreviation'],
+                                     concurrency=concurrency):
+            if platforms is not None:
+                platforms.append(platform)
+            # Generate a CSV file to save for the adjusted price data.
+            if csv_writer is not None:
+                csv_writer.write(platform)
+            counter += 1
+    finally:
+        if csv_writer is not None:
+            csv_writer.close()
     print("Generated data for all", counter, "platform observations.")
-    df = pd.DataFrame(platforms)
     # Generate a plot/bar graph for the adjusted price data.
-    if PLOT_FILE:
-        generate_plot(platforms, PLOT_FILE)
-    # Generate a CSV file to save for the adjusted price data.
-    if CSV_FILE:
-        generate_csv(platforms, CSV_FILE)
+    if plot_file:
+        generate_plot(platforms, plot_file)
+    print("Giantbomb request metrics:", gb_api.limiter.metrics())
+    return counter
+
 
 if __name__ == "__main__":
     main()
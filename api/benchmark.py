@@ -0,0 +1,310 @@
+'''
+Benchmarks for the API project.
+
+Kate Hess
+From Lynn Root's newcoder.io - APIs project
+
+Runs offline against synthetic data so no API key or network is needed.
+
+    python benchmark.py cpi-parser --years 2000 --series 8
+    python benchmark.py dataset --platforms 100000
+    python benchmark.py plot --sizes 100 1000 10000
+    python benchmark.py end-to-end --total 5000 --latency 0.05
+    python benchmark.py rate-limit --server-rate 20
+    python benchmark.py resources --total 50000
+'''
+
+import argparse
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import api_internal_script as api
+from stub_server import start_stub_server
+
+
+def timed(fn, repeat=5):
+    '''Returns best wall time in seconds of repeat calls of fn.'''
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def make_fred_text(years, series, first_year=1800):
+    '''Builds a synthetic monthly FRED text file w/ several series.'''
+    rng = np.random.RandomState(0)
+    lines = ["Title:               Synthetic CPI data",
+             "Frequency:           Monthly",
+             "",
+             "DATE        " + "  ".join("SERIES%d" % i
+                                         for i in range(series))]
+    values = rng.uniform(10, 300, size=(years * 12, series))
+    row = 0
+    for year in range(first_year, first_year + years):
+        for month in range(1, 13):
+            cols = "  ".join("%8.3f" % v for v in values[row])
+            lines.append("%04d-%02d-01  %s" % (year, month, cols))
+            row += 1
+    return "\n".join(lines) + "\n"
+
+
+def legacy_load_from_file(file):
+    '''The original line-by-line DataFrame loader, kept for comparison.'''
+    data = []
+    dataline = False
+    for line in file:
+        if dataline:
+            data.append(line.rstrip().split())
+        if line.startswith("DATE"):
+            dataline = True
+    data = pd.DataFrame(data)
+    data = data.iloc[:, :2]
+    data.columns = ['date', 'cpi']
+    data['year'] = data.date.apply(lambda x: int(x.split('-')[0]))
+    data['cpi'] = data.cpi.astype(float)
+    return data.groupby('year').mean(numeric_only=True)
+
+
+def bench_cpi_parser(opts):
+    text = make_fred_text(opts.years, opts.series)
+    rows = opts.years * 12
+    print("Synthetic FRED file: {0} rows x {1} series, {2:.1f} MB".format(
+        rows, opts.series, len(text) / 1e6))
+    legacy = timed(lambda: legacy_load_from_file(io.StringIO(text)))
+    fast = timed(lambda: api.parse_fred(io.StringIO(text)))
+    print("legacy loader:  {0:8.1f} ms ({1:,.0f} rows/s)".format(
+        legacy * 1e3, rows / legacy))
+    print("parse_fred:     {0:8.1f} ms ({1:,.0f} rows/s)".format(
+        fast * 1e3, rows / fast))
+    print("speedup:        {0:8.1f}x".format(legacy / fast))
+
+
+def make_platforms(count):
+    '''Builds enriched platform dicts shaped like the pipeline's output.'''
+    rng = np.random.RandomState(0)
+    years = rng.randint(1972, 2017, size=count)
+    prices = rng.uniform(50, 800, size=count).round(2)
+    return [{'abbreviation': 'P%d' % i,
+             'name': 'Platform number %d' % i,
+             'release_date': '%d-01-01 00:00:00' % years[i],
+             'original_price': float(prices[i]),
+             'region': api.DEFAULT_REGION,
+             'year': int(years[i]),
+             'adjusted_price': float(prices[i]) * 1.5}
+            for i in range(count)]
+
+
+def build_list(platforms):
+    '''The old path: keep every API dict, then convert for output.'''
+    kept = []
+    for platform in platforms:
+        kept.append(dict(platform))
+    return kept, pd.DataFrame(kept)
+
+
+def build_dataset(platforms):
+    dataset = api.PlatformDataset()
+    for platform in platforms:
+        dataset.append(dict(platform))
+    return dataset
+
+
+def measure_memory(fn):
+    '''Returns (result, peak bytes allocated while building it).'''
+    tracemalloc.start()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, peak
+
+
+def bench_dataset(opts):
+    platforms = make_platforms(opts.platforms)
+    print("Building {0:,} platforms".format(opts.platforms))
+    for label, build in (('list + DataFrame', build_list),
+                         ('PlatformDataset', build_dataset)):
+        elapsed = timed(lambda: build(platforms), repeat=3)
+        _, peak = measure_memory(lambda: build(platforms))
+        print("{0:18} {1:8.1f} ms {2:8.1f} MB peak".format(
+            label, elapsed * 1e3, peak / 1e6))
+
+
+def bench_plot(opts):
+    outfile = os.path.join(tempfile.mkdtemp(), 'plot.png')
+    for size in opts.sizes:
+        dataset = build_dataset(make_platforms(size))
+        for mode in ('auto', 'year', 'top'):
+            elapsed = timed(lambda: api.generate_plot(dataset, outfile,
+                                                      mode=mode),
+                            repeat=opts.repeat)
+            print("{0:>7,} platforms  {1:5} {2:8.1f} ms {3:8.1f} KB".format(
+                size, mode, elapsed * 1e3, os.path.getsize(outfile) / 1e3))
+
+
+def bench_end_to_end(opts):
+    server = start_stub_server(total=opts.total, page_size=opts.page_size,
+                               latency=opts.latency,
+                               error_rate=opts.error_rate)
+    outdir = tempfile.mkdtemp()
+    print("Stub server at {0}: {1:,} platforms, {2} per page, "
+          "{3:.0f} ms latency".format(server.base_url, opts.total,
+                                      opts.page_size, opts.latency * 1e3))
+    results = []
+    try:
+        for concurrency in opts.concurrency:
+            # Fresh CPI file each run, so the download path is included
+            cpi_file = os.path.join(outdir, 'cpi-%d.txt' % concurrency)
+            start = time.perf_counter()
+            # The stub doesn't throttle here, so don't hold the client back
+            limiter = api.RateLimiter(rate=1e6, burst=concurrency,
+                                      concurrency=concurrency,
+                                      max_concurrency=concurrency)
+            count = api.main(api_key='stub', base_url=server.base_url,
+                             cpi_data_url=server.cpi_url, cpi_file=cpi_file,
+                             plot_file=None,
+                             csv_file=os.path.join(outdir, 'out.csv'),
+                             concurrency=concurrency, limiter=limiter)
+            results.append((concurrency, count,
+                            time.perf_counter() - start))
+    finally:
+        server.shutdown()
+    print("Stub served {0} requests ({1} injected errors)".format(
+        server.requests, server.errors))
+    for concurrency, count, elapsed in results:
+        mode = 'sequential' if concurrency <= 1 else \
+            'concurrent x%d' % concurrency
+        print("{0:15} {1:,} platforms in {2:6.2f} s ({3:,.0f}/s)".format(
+            mode, count, elapsed, count / elapsed))
+
+
+def bench_rate_limit(opts):
+    server = start_stub_server(total=opts.total, latency=opts.latency,
+                               rate_limit=opts.server_rate)
+    print("Stub server allows {0} requests/s; fetching {1} pages w/ {2} "
+          "threads".format(opts.server_rate, opts.total // 100,
+                           opts.concurrency))
+    # Flat out from the first request vs. slow start probing upward
+    limiters = [
+        ('greedy', api.RateLimiter(rate=1e6, burst=opts.concurrency,
+                                   concurrency=opts.concurrency,
+                                   max_concurrency=opts.concurrency)),
+        ('slow start', api.RateLimiter(rate=1.0, max_rate=1e3,
+                                       rate_step=1.0,
+                                       max_concurrency=opts.concurrency)),
+    ]
+    try:
+        for label, limiter in limiters:
+            gb_api = api.GiantbombAPI('stub', server.base_url, limiter)
+            start = time.perf_counter()
+            throttled_before = server.throttled
+            rows = 0
+            try:
+                for page, _ in gb_api.get_platform_pages(
+                        concurrency=opts.concurrency):
+                    rows += len(page)
+                outcome = 'ok'
+            except Exception as exc:
+                outcome = 'failed: {0}'.format(exc)
+            elapsed = time.perf_counter() - start
+            metrics = limiter.metrics()
+            print("{0:10} {1:6,} rows {2:6.2f} s  {3:4} server 420s  "
+                  "final {4:.1f} req/s x{5:.1f}  {6}".format(
+                      label, rows, elapsed,
+                      server.throttled - throttled_before,
+                      metrics['rate'], metrics['concurrency'], outcome))
+    finally:
+        server.shutdown()
+
+
+def bench_resources(opts):
+    server = start_stub_server(total=opts.total, latency=opts.latency)
+    limiter = api.RateLimiter(rate=1e6, burst=opts.concurrency,
+                              concurrency=opts.concurrency,
+                              max_concurrency=opts.concurrency)
+    gb_api = api.GiantbombAPI('stub', server.base_url, limiter)
+    fields = ['id', 'name', 'original_release_date']
+    print("Paging {0:,} rows per resource, {1:.0f} ms latency".format(
+        opts.total, opts.latency * 1e3))
+    try:
+        for resource in ('games', 'releases'):
+            for concurrency, field_list in ((1, None),
+                                            (opts.concurrency, None),
+                                            (opts.concurrency, fields)):
+                start = time.perf_counter()
+                rows = sum(1 for _ in gb_api.get_resource(
+                    resource, field_list=field_list,
+                    concurrency=concurrency))
+                elapsed = time.perf_counter() - start
+                print("{0:9} x{1:<3} {2:10} {3:8,} rows {4:6.2f} s "
+                      "({5:,.0f} rows/s)".format(
+                          resource, concurrency,
+                          'projected' if field_list else 'all fields',
+                          rows, elapsed, rows / elapsed))
+    finally:
+        server.shutdown()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    cpi = commands.add_parser('cpi-parser',
+                              help='FRED text parser vs legacy loader')
+    cpi.add_argument('--years', type=int, default=2000,
+                     help='Years of monthly data to generate')
+    cpi.add_argument('--series', type=int, default=8,
+                     help='Number of series columns to generate')
+    cpi.set_defaults(func=bench_cpi_parser)
+    dataset = commands.add_parser('dataset',
+                                  help='PlatformDataset vs list of dicts')
+    dataset.add_argument('--platforms', type=int, default=100000,
+                         help='Number of synthetic platforms')
+    dataset.set_defaults(func=bench_dataset)
+    plot = commands.add_parser('plot', help='generate_plot render time')
+    plot.add_argument('--sizes', type=int, nargs='+',
+                      default=[100, 1000, 10000],
+                      help='Platform counts to render')
+    plot.add_argument('--repeat', type=int, default=3)
+    plot.set_defaults(func=bench_plot)
+    e2e = commands.add_parser('end-to-end',
+                              help='main() against the offline stub server')
+    e2e.add_argument('--total', type=int, default=5000,
+                     help='Platforms reported by the stub')
+    e2e.add_argument('--page-size', type=int, default=100)
+    e2e.add_argument('--latency', type=float, default=0.05,
+                     help='Stub latency per request in seconds')
+    e2e.add_argument('--error-rate', type=float, default=0.0)
+    e2e.add_argument('--concurrency', type=int, nargs='+', default=[1, 8],
+                     help='Page fetch concurrency levels to compare')
+    e2e.set_defaults(func=bench_end_to_end)
+    rate = commands.add_parser('rate-limit',
+                               help='RateLimiter against a throttling stub')
+    rate.add_argument('--total', type=int, default=10000)
+    rate.add_argument('--latency', type=float, default=0.02)
+    rate.add_argument('--server-rate', type=float, default=20,
+                      help='Requests/s the stub allows before 420s')
+    rate.add_argument('--concurrency', type=int, default=8)
+    rate.set_defaults(func=bench_rate_limit)
+    resources = commands.add_parser('resources',
+                                    help='Generic pager on /games/, '
+                                         '/releases/')
+    resources.add_argument('--total', type=int, default=50000)
+    resources.add_argument('--latency', type=float, default=0.05)
+    resources.add_argument('--concurrency', type=int, default=8)
+    resources.set_defaults(func=bench_resources)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    opts = parse_args()
+    opts.func(opts)
@@ -0,0 +1,245 @@
+'''
+Offline stand-in for the Giantbomb and FRED endpoints used by
+api_internal_script.py.
+
+Kate Hess
+From Lynn Root's newcoder.io - APIs project
+
+Replays the platforms recorded in fixtures/platforms.csv as
+/api/platforms/ pages (cycled to reach any total count), serves synthetic
+/api/games/ and /api/releases/ pages and serves CPIAUCSL.txt at the FRED
+path. Page size, total count, per-request latency, injected errors and a
+420-enforced rate limit are configurable, so the client can be benchmarked
+without network or key.
+
+    python stub_server.py --total 5000 --latency 0.05
+
+benchmark.py end-to-end starts one in-process via start_stub_server().
+'''
+
+import argparse
+import csv
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# Kept apart from the script's own output (full_data.csv), which it
+# overwrites w/ a different header
+RECORDED_FILE = os.path.join(HERE, 'fixtures', 'platforms.csv')
+CPI_FILE = os.path.join(HERE, 'CPIAUCSL.txt')
+RESOURCE_PATH = re.compile(r'^/api/(\w+)/$')
+CPI_PATH = '/fred2/data/CPIAUCSL.txt'
+
+
+def load_recorded_platforms(path=RECORDED_FILE):
+    '''Reads recorded platform rows (as the API returns them) from CSV.'''
+    with open(path, newline='') as fp:
+        return [{'abbreviation': row['abbreviation'],
+                 'name': row['name'],
+                 'original_price': row['original_price'],
+                 'release_date': row['release_date']}
+                for row in csv.DictReader(fp)]
+
+
+class StubServer(ThreadingHTTPServer):
+    '''Threaded HTTP server holding the stub configuration and counters.'''
+    daemon_threads = True
+
+    def __init__(self, address, total=None, page_size=100, latency=0.0,
+                 error_rate=0.0, error_status=500, rate_limit=None, seed=0):
+        ThreadingHTTPServer.__init__(self, address, StubHandler)
+        self.recorded = load_recorded_platforms()
+        self.total = len(self.recorded) if total is None else total
+        self.page_size = page_size
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        # Emulates Giantbomb's per-key limit w/ a token bucket
+        self.rate_limit = rate_limit
+        self.tokens = rate_limit or 0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+
+    @property
+    def root_url(self):
+        host, port = self.server_address[:2]
+        return 'http://{0}:{1}'.format(host, port)
+
+    @property
+    def base_url(self):
+        '''Drop-in for GIANTBOMB_URL.'''
+        return self.root_url + '/api'
+
+    @property
+    def cpi_url(self):
+        '''Drop-in for CPI_DATA_URL.'''
+        return self.root_url + CPI_PATH
+
+    def row(self, resource, index):
+        '''Returns the index-th row of resource, or None if unknown.'''
+        if resource == 'platforms':
+            return self.platform(index)
+        if resource == 'games':
+            return self.game(index)
+        if resource == 'releases':
+            return self.release(index)
+        return None
+
+    def platform(self, index):
+        '''Returns the index-th platform, cycling through the recording.'''
+        row = dict(self.recorded[index % len(self.recorded)])
+        cycle = index // len(self.recorded)
+        if cycle:
+            row['name'] = u"{0} #{1}".format(row['name'], cycle)
+            row['abbreviation'] = u"{0}{1}".format(row['abbreviation'], cycle)
+        return row
+
+    def game(self, index):
+        '''Synthetic game, w/ roughly the shape (and bulk) of the real one.'''
+        platform = self.platform(index % 50)
+        return {'id': index + 1,
+                'name': u"Game {0}".format(index + 1),
+                'deck': u"Synthetic game {0}, served by the stub server for "
+                        u"benchmarking.".format(index + 1),
+                'original_release_date': '{0}-{1:02d}-01 00:00:00'.format(
+                    1980 + index % 37, 1 + index % 12),
+                'platforms': [{'id': index % 50 + 1,
+                               'name': platform['name'],
+                               'abbreviation': platform['abbreviation']}],
+                'api_detail_url': u"{0}/game/3030-{1}/".format(
+                    self.base_url, index + 1),
+                'site_detail_url': u"http://www.giantbomb.com/game/"
+                                   u"3030-{0}/".format(index + 1)}
+
+    def release(self, index):
+        '''Synthetic regional release of a synthetic game.'''
+        game = self.game(index // 3)
+        return {'id': index + 1,
+                'name': game['name'],
+                'game': {'id': game['id'], 'name': game['name']},
+                'platform': game['platforms'][0],
+                'region': {'id': index % 3 + 1,
+                           'name': ['United States', 'United Kingdom',
+                                    'Japan'][index % 3]},
+                'release_date': game['original_release_date'],
+                'api_detail_url': u"{0}/release/3050-{1}/".format(
+                    self.base_url, index + 1)}
+
+    def should_fail(self):
+        '''Returns an HTTP status to fail the current request with, if any.'''
+        with self.lock:
+            self.requests += 1
+            if self.rate_limit:
+                now = time.monotonic()
+                self.tokens = min(self.rate_limit, self.tokens +
+                                  (now - self.updated) * self.rate_limit)
+                self.updated = now
+                if self.tokens < 1:
+                    self.throttled += 1
+                    return 420
+                self.tokens -= 1
+            if self.error_rate and self.random.random() < self.error_rate:
+                self.errors += 1
+                return self.error_status
+        return None
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    '''Serves resource pages and the CPI file.'''
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        status = self.server.should_fail()
+        if status:
+            return self.send_body(status, b'', 'text/plain')
+        resource = RESOURCE_PATH.match(url.path)
+        if resource and self.server.row(resource.group(1), 0) is not None:
+            return self.send_page(resource.group(1), parse_qs(url.query))
+        if url.path == CPI_PATH:
+            with open(CPI_FILE, 'rb') as fp:
+                return self.send_body(200, fp.read(), 'text/plain')
+        self.send_body(404, b'', 'text/plain')
+
+    def send_page(self, resource, query):
+        server = self.server
+        offset = int(query.get('offset', ['0'])[0])
+        limit = min(int(query.get('limit', [server.page_size])[0]),
+                    server.page_size)
+        rows = [server.row(resource, i)
+                for i in range(offset, min(offset + limit, server.total))]
+        # Honour field_list projection like the real API
+        if 'field_list' in query:
+            fields = query['field_list'][0].split(',')
+            rows = [{k: row.get(k) for k in fields} for row in rows]
+        body = json.dumps({'error': 'OK',
+                           'status_code': 1,
+                           'limit': limit,
+                           'offset': offset,
+                           'number_of_page_results': len(rows),
+                           'number_of_total_results': server.total,
+                           'results': rows})
+        self.send_body(200, body.encode('utf-8'), 'application/json')
+
+    def send_body(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Keep benchmark output readable
+        pass
+
+
+def start_stub_server(host='127.0.0.1', port=0, **config):
+    '''Starts a StubServer in a background thread. port=0 picks a free
+    port; read it back from server.base_url. Stop w/ server.shutdown().'''
+    server = StubServer((host, port), **config)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--total', type=int,
+                        help='Total platforms to report (default: recording)')
+    parser.add_argument('--page-size', type=int, default=100,
+                        help='Max platforms per page')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds to wait before answering each request')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Fraction of requests to fail')
+    parser.add_argument('--error-status', type=int, default=500,
+                        help='HTTP status for injected failures')
+    parser.add_argument('--rate-limit', type=float,
+                        help='Requests per second before answering 420')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    opts = parse_args()
+    server = StubServer((opts.host, opts.port), total=opts.total,
+                        page_size=opts.page_size, latency=opts.latency,
+                        error_rate=opts.error_rate,
+                        error_status=opts.error_status,
+                        rate_limit=opts.rate_limit)
+    print("Serving Giantbomb at", server.base_url)
+    print("Serving FRED CPI data at", server.cpi_url)
+    server.serve_forever()
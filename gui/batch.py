@@ -0,0 +1,169 @@
+'''
+Headless batch solver for puzzle files.
+
+Reads one puzzle per line ('0' or '.' for empty cells): 81 chars for
+9x9, 256 for 16x16 w/ values 1-9 then A-G, and so on. Solves them across
+a pool of worker processes and writes one CSV row per puzzle as results
+come in, in input order:
+
+    puzzle,solution,status
+
+status is solved, unsolvable, multiple (w/ --validate, more than one
+solution) or invalid (not a puzzle). Progress and totals go to stderr.
+
+    python batch.py puzzles.txt solutions.csv --workers 8 --validate
+'''
+
+import argparse
+import collections
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import solver
+from board import SudokuError, format_board, parse_board
+
+
+def read_chunks(lines, chunk_size):
+    '''Groups puzzle lines into lists of chunk_size, skipping blanks.'''
+    chunk = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        chunk.append(line)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def solve_line(line, method='propagate', validate=False):
+    '''Returns (solution string or '', status) for one puzzle line.'''
+    try:
+        # One line only: a line w/ spaces mustn't parse as a grid
+        solver.box_size(len(line))
+        cells = parse_board(line)
+    except (ValueError, SudokuError):
+        return '', 'invalid'
+    solutions = solver.SOLVERS[method](cells).search(2 if validate else 1)
+    if not solutions:
+        return '', 'unsolvable'
+    solution = format_board(solutions[0])
+    return solution, 'multiple' if len(solutions) > 1 else 'solved'
+
+
+def solve_chunk(chunk, method='propagate', validate=False):
+    '''Worker: solves a chunk of puzzle lines.'''
+    return [(line,) + solve_line(line, method, validate) for line in chunk]
+
+
+class BatchStats(object):
+    '''Running totals for a batch.'''
+
+    def __init__(self):
+        self.started = time.time()
+        self.shown = 0.0
+        self.counts = collections.Counter()
+
+    @property
+    def puzzles(self):
+        return sum(self.counts.values())
+
+    def add(self, status):
+        self.counts[status] += 1
+
+    def report(self):
+        elapsed = max(time.time() - self.started, 1e-9)
+        report = {'puzzles': self.puzzles,
+                  'elapsed': elapsed,
+                  'puzzles_per_sec': self.puzzles / elapsed}
+        report.update(self.counts)
+        return report
+
+
+def solve_file(infile, outfile, workers=None, chunk_size=500,
+               method='propagate', validate=False, progress=None):
+    '''Solves the puzzles in infile (file obj) into outfile (file obj)
+    across workers processes. At most 2 chunks per worker are in flight,
+    so memory stays flat however long the file is. progress, if given, is
+    called w/ the stats after each chunk. Returns the BatchStats.'''
+    workers = workers or os.cpu_count() or 1
+    stats = BatchStats()
+    writer = csv.writer(outfile, lineterminator='\n')
+    writer.writerow(('puzzle', 'solution', 'status'))
+    with ProcessPoolExecutor(workers) as pool:
+        pending = collections.deque()
+        chunks = read_chunks(infile, chunk_size)
+        for chunk in chunks:
+            pending.append(pool.submit(solve_chunk, chunk, method, validate))
+            if len(pending) >= 2 * workers:
+                write_results(pending.popleft().result(), writer, stats)
+                if progress:
+                    progress(stats)
+        while pending:
+            write_results(pending.popleft().result(), writer, stats)
+            if progress:
+                progress(stats)
+    return stats
+
+
+def write_results(results, writer, stats):
+    '''Writes CSV rows; invalid lines may hold commas or quotes.'''
+    for row in results:
+        writer.writerow(row)
+        stats.add(row[2])
+
+
+def print_progress(stats):
+    # Roughly once a second is plenty
+    now = time.time()
+    if now - stats.shown >= 1.0:
+        stats.shown = now
+        report = stats.report()
+        sys.stderr.write("\r{puzzles:,} puzzles, {puzzles_per_sec:,.0f}/s"
+                         .format(**report))
+        sys.stderr.flush()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('infile', help="Puzzle file, or - for stdin")
+    parser.add_argument('outfile', help="CSV file to write, or - for stdout")
+    parser.add_argument('--workers', type=int,
+                        help='Worker processes (default: one per core)')
+    parser.add_argument('--chunk-size', type=int, default=500,
+                        help='Puzzles per unit of work')
+    parser.add_argument('--method', choices=sorted(solver.SOLVERS),
+                        default='propagate')
+    parser.add_argument('--validate', action='store_true',
+                        help='Also check each puzzle has a unique solution')
+    parser.add_argument('--stats', help='Write the totals as JSON here')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    opts = parse_args()
+    infile = sys.stdin if opts.infile == '-' else open(opts.infile)
+    outfile = sys.stdout if opts.outfile == '-' else open(opts.outfile, 'w')
+    try:
+        stats = solve_file(infile, outfile, opts.workers, opts.chunk_size,
+                           opts.method, opts.validate, print_progress)
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+        if outfile is not sys.stdout:
+            outfile.close()
+    report = stats.report()
+    sys.stderr.write("\r" + ", ".join(
+        "{0} {1}".format(key, value) for key, value in sorted(report.items())
+        if key not in ('elapsed', 'puzzles_per_sec')))
+    sys.stderr.write(" in {elapsed:.1f} s ({puzzles_per_sec:,.0f}/s)\n"
+                     .format(**report))
+    if opts.stats:
+        with open(opts.stats, 'w') as out:
+            json.dump(report, out, indent=2)
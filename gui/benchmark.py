@@ -0,0 +1,444 @@
+'''
+Benchmarks for the Sudoku project.
+
+Puzzle files have one puzzle per line, 81 chars w/ '0' or '.' for empty
+cells; blank lines and lines starting w/ '#' are skipped.
+
+    python benchmark.py solver --repeat 20
+    python benchmark.py solver --files top95.txt hardest.txt
+    python benchmark.py batch --puzzles 20000 --workers 1 4
+    python benchmark.py moves --moves 100000
+    python benchmark.py load --puzzles 100000
+    python benchmark.py sizes --boxes 3 4 5 --puzzles 5
+    python benchmark.py redraw --boxes 3 4 5   # needs a display
+    python benchmark.py generate --puzzles 200 --workers 1 4
+'''
+
+import argparse
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import batch
+import generator
+import solver
+import sudoku
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+HARDEST_FILE = os.path.join(HERE, 'puzzles', 'hardest.txt')
+
+
+def read_puzzles(path):
+    '''Returns the puzzles in path as flat lists of 81 ints.'''
+    puzzles = []
+    with open(path) as fp:
+        for line in fp:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            puzzles.append([0 if c in '.0' else int(c) for c in line])
+    return puzzles
+
+
+def bench_solver(opts):
+    for path in opts.files:
+        puzzles = read_puzzles(path)
+        print("{0}: {1:,} puzzles".format(os.path.basename(path),
+                                          len(puzzles)))
+        for method in sorted(solver.SOLVERS):
+            engine = solver.SOLVERS[method]
+            for label, run in (
+                    ('solve', lambda p: engine(p).solve()),
+                    ('count(2)', lambda p: engine(p).count_solutions(2))):
+                start = time.perf_counter()
+                worst = 0.0
+                for _ in range(opts.repeat):
+                    for puzzle in puzzles:
+                        started = time.perf_counter()
+                        run(puzzle)
+                        worst = max(worst, time.perf_counter() - started)
+                elapsed = time.perf_counter() - start
+                solved = len(puzzles) * opts.repeat
+                print("  {0:9} {1:8} {2:8,.1f} puzzles/s  {3:6.2f} ms avg  "
+                      "{4:7.2f} ms worst".format(
+                          method, label, solved / elapsed,
+                          1e3 * elapsed / solved, 1e3 * worst))
+
+
+def shuffle_puzzle(puzzle, rng):
+    '''Returns an equivalent puzzle: digits relabelled, rows shuffled
+    within bands, bands shuffled, and maybe transposed.'''
+    digits = list(range(1, 10))
+    rng.shuffle(digits)
+    bands = rng.sample(range(3), 3)
+    order = [band * 3 + r for band in bands for r in rng.sample(range(3), 3)]
+    rows = [[puzzle[r * 9 + c] for c in range(9)] for r in order]
+    if rng.random() < 0.5:
+        rows = [list(col) for col in zip(*rows)]
+    return [digits[v - 1] if v else 0 for row in rows for v in row]
+
+
+def make_puzzle_file(count, path=HARDEST_FILE, seed=0):
+    '''Returns count puzzles (one per line) shuffled from the corpus.'''
+    rng = random.Random(seed)
+    corpus = read_puzzles(path)
+    return ''.join(
+        ''.join(str(v) if v else '.' for v in
+                shuffle_puzzle(corpus[i % len(corpus)], rng)) + '\n'
+        for i in range(count))
+
+
+def bench_batch(opts):
+    text = make_puzzle_file(opts.puzzles)
+    print("{0:,} shuffled hard puzzles, chunks of {1}".format(
+        opts.puzzles, opts.chunk_size))
+    for workers in opts.workers:
+        out = io.StringIO()
+        stats = batch.solve_file(io.StringIO(text), out, workers,
+                                 opts.chunk_size, validate=opts.validate)
+        report = stats.report()
+        print("  {0:2} workers {1:8,} puzzles {2:7.2f} s ({3:,.0f}/s) "
+              "solved {4:,}".format(workers, report['puzzles'],
+                                    report['elapsed'],
+                                    report['puzzles_per_sec'],
+                                    report.get('solved', 0)))
+
+
+def legacy_check_win(puzzle):
+    '''The original check_win: rebuilds 27 sets on every call.'''
+    def check_block(block):
+        return set(block) == set(range(1, 10))
+    for row in range(9):
+        if not check_block(puzzle[row]):
+            return False
+    for column in range(9):
+        if not check_block([puzzle[row][column] for row in range(9)]):
+            return False
+    for row in range(3):
+        for column in range(3):
+            if not check_block([puzzle[r][c]
+                                for r in range(row * 3, (row + 1) * 3)
+                                for c in range(column * 3, (column + 1) * 3)]):
+                return False
+    return True
+
+
+def make_endgame(open_cells, count, seed=0):
+    '''Returns (board, moves): a solved hard puzzle w/ open_cells cells
+    cleared, and count random moves (row, column, value) on them. The end
+    of a game is where every check_win() has to look at the whole board.'''
+    rng = random.Random(seed)
+    puzzle = read_puzzles(HARDEST_FILE)[0]
+    board = solver.solve(puzzle)
+    cells = rng.sample([i for i in range(81) if not puzzle[i]], open_cells)
+    solution = {}
+    for i in cells:
+        solution[i] = board[i // 9][i % 9]
+        board[i // 9][i % 9] = 0
+    moves = []
+    for _ in range(count):
+        i = rng.choice(cells)
+        value = solution[i] if rng.random() < 0.5 else rng.randint(0, 9)
+        moves.append((i // 9, i % 9, value))
+    return board, moves
+
+
+def bench_moves(opts):
+    board, moves = make_endgame(opts.open, opts.moves)
+    text = ''.join(''.join(map(str, row)) + '\n' for row in board)
+    game = sudoku.SudokuGame(io.StringIO(text))
+
+    def legacy():
+        puzzle = [list(row) for row in board]
+        wins = 0
+        for row, column, value in moves:
+            puzzle[row][column] = value
+            wins += legacy_check_win(puzzle)
+        return wins
+
+    def incremental():
+        game.start()
+        wins = 0
+        for row, column, value in moves:
+            game.set_cell(row, column, value)
+            wins += game.check_win()
+        return wins
+
+    print("{0:,} moves on {1} open cells, each followed by check_win()"
+          .format(opts.moves, opts.open))
+    for label, run in (('full rescan', legacy), ('incremental', incremental)):
+        start = time.perf_counter()
+        wins = run()
+        elapsed = time.perf_counter() - start
+        print("  {0:12} {1:8.3f} s ({2:10,.0f} moves/s, {3:5.2f} us/move) "
+              "{4:,} wins".format(label, elapsed, opts.moves / elapsed,
+                                  1e6 * elapsed / opts.moves, wins))
+
+
+def legacy_create_board(board_file):
+    '''The original parser: lists of lists, one char at a time.'''
+    board = []
+    for line in board_file:
+        line = line.strip()
+        if len(line) != 9:
+            raise sudoku.SudokuError("Each line must be 9 chars long.")
+        board.append([])
+        for c in line:
+            if not c.isdigit():
+                raise sudoku.SudokuError("Valid characters are 0-9.")
+            board[-1].append(int(c))
+    if len(board) != 9:
+        raise sudoku.SudokuError("Each puzzle must be 9 lines long.")
+    return board
+
+
+def legacy_copy(board):
+    '''The original SudokuGame.start() copy, cell by cell.'''
+    puzzle = []
+    for i in range(9):
+        puzzle.append([])
+        for j in range(9):
+            puzzle[i].append(board[i][j])
+    return puzzle
+
+
+def bench_load(opts):
+    lines = make_puzzle_file(opts.puzzles).replace('.', '0').splitlines()
+    # The 9-line format, as the legacy parser needs
+    grids = [[line[i:i + 9] for i in range(0, 81, 9)] for line in lines]
+    data = ('\n'.join(lines) + '\n').encode('ascii')
+    print("{0:,} puzzles, loaded and copied once each".format(opts.puzzles))
+
+    def legacy():
+        for grid in grids:
+            legacy_copy(legacy_create_board(grid))
+
+    def nine_lines():
+        for grid in grids:
+            bytearray(sudoku.parse_board('\n'.join(grid)))
+
+    def bulk():
+        for cells in sudoku.read_boards(io.BytesIO(data)):
+            bytearray(cells)
+
+    for label, run in (('legacy 9-line', legacy),
+                       ('parse_board 9-line', nine_lines),
+                       ('read_boards 81-char', bulk)):
+        elapsed = timed(run, opts.repeat)
+        print("  {0:20} {1:7.3f} s ({2:10,.0f} puzzles/s)".format(
+            label, elapsed, opts.puzzles / elapsed))
+    board = legacy_create_board(grids[0])
+    print("  one board: lists {0} bytes, bytearray {1} bytes".format(
+        sys.getsizeof(board) + sum(sys.getsizeof(row) for row in board),
+        sys.getsizeof(sudoku.parse_board(lines[0]))))
+
+
+def timed(fn, repeat=3):
+    '''Returns best wall time in seconds of repeat calls of fn.'''
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+# Share of cells blanked per box size; past these, puzzles get slow to
+# make unique one cell at a time on 25x25
+BLANK = {2: 0.7, 3: 0.65, 4: 0.6, 5: 0.45}
+
+
+def make_puzzle(box, blank, rng):
+    '''Returns a unique puzzle w/ box x box boxes: a solved board w/ digits
+    relabelled, then cells cleared in random order while the solution
+    stays unique, until blank of them are empty.'''
+    geo = solver.geometry(box)
+    grid = solver.flatten(solver.solve([0] * geo.cells))
+    digits = rng.sample(range(1, geo.digits + 1), geo.digits)
+    puzzle = [digits[v - 1] for v in grid]
+    cleared = 0
+    for i in rng.sample(range(geo.cells), geo.cells):
+        if cleared >= blank * geo.cells:
+            break
+        value, puzzle[i] = puzzle[i], 0
+        if solver.count_solutions(puzzle, 2) == 1:
+            cleared += 1
+        else:
+            puzzle[i] = value
+    return puzzle
+
+
+def bench_sizes(opts):
+    rng = random.Random(opts.seed)
+    for box in opts.boxes:
+        size = box * box
+        blank = opts.blank or BLANK.get(box, 0.4)
+        start = time.perf_counter()
+        puzzles = [make_puzzle(box, blank, rng) for _ in range(opts.puzzles)]
+        print("{0}x{0}: {1} puzzles, {2:.0%} blank, made in {3:.2f} s".format(
+            size, len(puzzles), blank, time.perf_counter() - start))
+        for method in sorted(solver.SOLVERS):
+            engine = solver.SOLVERS[method]
+            start = time.perf_counter()
+            worst = 0.0
+            for puzzle in puzzles:
+                started = time.perf_counter()
+                engine(puzzle).solve()
+                worst = max(worst, time.perf_counter() - started)
+            elapsed = time.perf_counter() - start
+            print("  {0:9} {1:8,.1f} puzzles/s  {2:8.2f} ms avg  "
+                  "{3:8.2f} ms worst".format(
+                      method, len(puzzles) / elapsed,
+                      1e3 * elapsed / len(puzzles), 1e3 * worst))
+
+
+def legacy_draw_puzzle(canvas, game, side):
+    '''The original __draw_puzzle: deletes and recreates every number.'''
+    canvas.delete("numbers")
+    for i in range(game.size):
+        for j in range(game.size):
+            answer = game.get_cell(i, j)
+            if answer != 0:
+                x = sudoku.MARGIN + j * side + side // 2
+                y = sudoku.MARGIN + i * side + side // 2
+                original = game.start_puzzle[i * game.size + j]
+                if game.is_conflict(i, j):
+                    color = 'red'
+                elif answer == original:
+                    color = 'black'
+                else:
+                    color = 'sea green'
+                canvas.create_text(x, y, text=sudoku.CELL_CHARS[answer],
+                                   tags="numbers", fill=color)
+
+
+def bench_redraw(opts):
+    from tkinter import Tk
+    root = Tk()
+    rng = random.Random(opts.seed)
+    for box in opts.boxes:
+        puzzle = make_puzzle(box, BLANK.get(box, 0.4), rng)
+        game = sudoku.SudokuGame(sudoku.format_board(puzzle))
+        game.start()
+        ui = sudoku.SudokuUI(root, game)
+        open_cells = [i for i, value in enumerate(puzzle) if not value]
+        moves = [divmod(rng.choice(open_cells), game.size) +
+                 (rng.randint(0, game.size),) for _ in range(opts.moves)]
+
+        def full():
+            for row, col, value in moves:
+                game.set_cell(row, col, value)
+                legacy_draw_puzzle(ui.canvas, game, ui.side)
+                root.update_idletasks()
+
+        def dirty():
+            for row, col, value in moves:
+                game.set_cell(row, col, value)
+                ui.update_cell(row, col)
+                root.update_idletasks()
+
+        print("{0}x{0}: {1:,} moves, each drawn before the next".format(
+            game.size, opts.moves))
+        for label, run in (('full repaint', full), ('dirty cells', dirty)):
+            game.start()
+            ui.redraw()
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            print("  {0:12} {1:8.3f} s ({2:8.2f} ms/move)".format(
+                label, elapsed, 1e3 * elapsed / opts.moves))
+        ui.destroy()
+    root.destroy()
+
+
+def bench_generate(opts):
+    directory = tempfile.mkdtemp()
+    try:
+        for difficulty in opts.difficulties:
+            print("{0}: {1:,} puzzles".format(difficulty, opts.puzzles))
+            for workers in opts.workers:
+                start = time.perf_counter()
+                made = list(generator.generate(opts.puzzles, difficulty,
+                                               workers=workers, seed=0))
+                elapsed = time.perf_counter() - start
+                generator.add_to_cache(made, directory=directory)
+                on_target = sum(1 for _, graded in made
+                                if graded == difficulty)
+                print("  {0:2} workers {1:7.2f} s ({2:8,.1f} puzzles/s) "
+                      "{3:,} on target".format(workers, elapsed,
+                                               opts.puzzles / elapsed,
+                                               on_target))
+            rng = random.Random(0)
+            start = time.perf_counter()
+            generator.make_puzzle(difficulty, rng=rng)
+            fresh = time.perf_counter() - start
+            loads = 100
+            start = time.perf_counter()
+            for _ in range(loads):
+                generator.load_puzzle(difficulty, directory=directory,
+                                      rng=rng)
+            cached = (time.perf_counter() - start) / loads
+            print("  one puzzle: made {0:8.2f} ms, from cache {1:6.3f} ms"
+                  .format(1e3 * fresh, 1e3 * cached))
+    finally:
+        shutil.rmtree(directory)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    solve = commands.add_parser('solver', help='Solver puzzles/sec')
+    solve.add_argument('--files', nargs='+', default=[HARDEST_FILE],
+                       help='Puzzle files (default: puzzles/hardest.txt)')
+    solve.add_argument('--repeat', type=int, default=5)
+    solve.set_defaults(func=bench_solver)
+    pool = commands.add_parser('batch', help='batch.py across process pools')
+    pool.add_argument('--puzzles', type=int, default=20000)
+    pool.add_argument('--workers', type=int, nargs='+',
+                      default=[1, os.cpu_count() or 1])
+    pool.add_argument('--chunk-size', type=int, default=500)
+    pool.add_argument('--validate', action='store_true')
+    pool.set_defaults(func=bench_batch)
+    moves = commands.add_parser('moves', help='Move + check_win() cost')
+    moves.add_argument('--moves', type=int, default=100000)
+    moves.add_argument('--open', type=int, default=2,
+                       help='Cells left to fill')
+    moves.set_defaults(func=bench_moves)
+    load = commands.add_parser('load', help='Board parse + copy throughput')
+    load.add_argument('--puzzles', type=int, default=100000)
+    load.add_argument('--repeat', type=int, default=3)
+    load.set_defaults(func=bench_load)
+    sizes = commands.add_parser('sizes', help='Solver speed by board size')
+    sizes.add_argument('--boxes', type=int, nargs='+', default=[3, 4, 5],
+                       help='Box sizes: 3 for 9x9, 4 for 16x16, ...')
+    sizes.add_argument('--puzzles', type=int, default=5)
+    sizes.add_argument('--blank', type=float,
+                       help='Share of cells to clear (default: by size)')
+    sizes.add_argument('--seed', type=int, default=0)
+    sizes.set_defaults(func=bench_sizes)
+    redraw = commands.add_parser('redraw', help='SudokuUI cost per move')
+    redraw.add_argument('--boxes', type=int, nargs='+', default=[3, 4, 5])
+    redraw.add_argument('--moves', type=int, default=500)
+    redraw.add_argument('--seed', type=int, default=0)
+    redraw.set_defaults(func=bench_redraw)
+    generate = commands.add_parser('generate', help='generator.py throughput')
+    generate.add_argument('--puzzles', type=int, default=200)
+    generate.add_argument('--difficulties', nargs='+',
+                          choices=generator.DIFFICULTIES,
+                          default=generator.DIFFICULTIES)
+    generate.add_argument('--workers', type=int, nargs='+',
+                          default=[1, os.cpu_count() or 1])
+    generate.set_defaults(func=bench_generate)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    opts = parse_args()
+    opts.func(opts)
@@ -0,0 +1,82 @@
+'''
+Sudoku board text format, w/o the UI: shared by sudoku.py, batch.py and
+generator.py, which run headless.
+
+A board is N lines of N chars, or one line of N*N chars, N being 4, 9,
+16, 25, ... Values are 1-9, then A-Z for 10 and up ('0' or '.' for
+empty, letters in either case).
+'''
+
+import solver
+
+
+class SudokuError(Exception):
+    '''An application-specific error.'''
+    pass
+
+
+# Cell values as written in puzzles: 1-9, then letters for 10 and up on
+# boards bigger than 9x9
+CELL_CHARS = '.123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+# Puzzle chars to cell values, '.' and '0' being empty; anything else is
+# mapped out of range so one max() finds it
+CELL_VALUES = bytearray([255] * 256)
+CELL_VALUES[ord('0')] = 0
+for _value, _char in enumerate(CELL_CHARS):
+    CELL_VALUES[ord(_char)] = CELL_VALUES[ord(_char.lower())] = _value
+CELL_VALUES = bytes(CELL_VALUES)
+
+
+def parse_board(text):
+    '''Parses a board of N lines of N chars, or one line of N*N chars,
+    into a bytearray of cells (row by row, 0 for empty). N is a square:
+    4, 9, 16, 25, ...'''
+    if isinstance(text, str):
+        text = text.encode('ascii', 'replace')
+    lines = text.split()
+    if len(lines) == 1 and len(lines[0]) >= 16:
+        data = lines[0]
+        try:
+            size = solver.geometry(solver.box_size(len(data))).digits
+        except ValueError:
+            raise SudokuError(
+                "A one line Sudoku puzzle must be 16, 81, 256, ... "
+                "chars long."
+            )
+    else:
+        size = len(lines[0]) if lines else 0
+        if any(len(line) != size for line in lines):
+            raise SudokuError(
+                "Each line in the Sudoku board must be "
+                "{0} chars long.".format(size)
+            )
+        if len(lines) != size:
+            raise SudokuError(
+                "Each Sudoku puzzle must be {0} lines long.".format(size)
+            )
+        if size < 4 or int(round(size ** 0.5)) ** 2 != size:
+            raise SudokuError(
+                "A Sudoku board must be 4, 9, 16, 25, ... cells wide."
+            )
+        data = b''.join(lines)
+    cells = bytearray(data.translate(CELL_VALUES))
+    if max(cells) > size:
+        raise SudokuError(
+            "Valid characters for a {0}x{0} Sudoku puzzle are 0 or '.' "
+            "and 1-{1}.".format(size, CELL_CHARS[size])
+        )
+    return cells
+
+
+def format_board(cells):
+    '''Returns cells as one line, '.' for empty.'''
+    return ''.join(CELL_CHARS[value] for value in cells)
+
+
+def read_boards(board_file):
+    '''Yields the boards in a file w/ one puzzle per line (text or
+    binary), skipping blank lines and '#' comments.'''
+    for line in board_file:
+        line = line.strip()
+        if line and line[:1] not in ('#', b'#'):
+            yield parse_board(line)
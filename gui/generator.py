@@ -0,0 +1,258 @@
+'''
+Sudoku puzzle generator.
+
+Puzzles are dug out of a shuffled solved board one cell at a time; a cell
+stays empty only if the puzzle keeps a unique solution (counting stops at
+2) and doesn't get harder than asked for. Difficulty is graded by what
+the propagating solver needs to get through it:
+
+    easy    naked singles only
+    medium  hidden singles too
+    hard    up to HARD_GUESSES guesses
+    expert  more guesses than that
+
+Digging a whole 16x16 or 25x25 board one count at a time takes minutes,
+so bigger boards stop at a share of blank cells (MAX_BLANK) and only go
+up to the difficulties they reach that way (HARDEST); other box sizes
+aren't served.
+
+Generated puzzles are cached by size and difficulty, one per line, in
+puzzles/generated/, so SudokuGame can start a fresh one instantly:
+
+    python generator.py --difficulty hard --count 1000 --workers 8
+    python generator.py --stats
+    python sudoku.py --difficulty hard
+'''
+
+import argparse
+import collections
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import solver
+from board import format_board
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(HERE, 'puzzles', 'generated')
+DIFFICULTIES = ['easy', 'medium', 'hard', 'expert']
+HARD_GUESSES = 10
+# Attempts at a puzzle of the asked difficulty before settling for an
+# easier one; some boards can't be dug out past a given difficulty
+ATTEMPTS = 20
+# Puzzles load_puzzle() makes w/ an empty cache before it settles for an
+# easier one
+LOAD_ATTEMPTS = 3
+# Share of cells digging stops at, and the hardest difficulty reached
+# within it, by box size (3 for 9x9, ...). 25x25 boards past 45% blank
+# have counts that run for seconds; inside it they grade medium at most.
+MAX_BLANK = {3: 1.0, 4: 0.6, 5: 0.45}
+HARDEST = {3: 'expert', 4: 'expert', 5: 'medium'}
+
+# Solved boards by box size, to shuffle into new ones
+SOLVED = {}
+
+
+def grade(puzzle):
+    '''Returns the difficulty of puzzle, or None if it doesn't have
+    exactly one solution.'''
+    engine = solver.SudokuSolver(puzzle)
+    if engine.count_solutions(2) != 1:
+        return None
+    # Counting searches the whole tree, so the counters don't depend on
+    # how soon the solution turned up
+    if engine.guesses > HARD_GUESSES:
+        return 'expert'
+    if engine.guesses:
+        return 'hard'
+    if engine.hidden_singles:
+        return 'medium'
+    return 'easy'
+
+
+def solved_board(box, rng):
+    '''Returns a random solved board w/ box x box boxes: digits
+    relabelled, rows shuffled within bands and bands shuffled, likewise
+    columns and stacks.'''
+    if box not in SOLVED:
+        SOLVED[box] = solver.flatten(solver.solve([0] * box ** 4))
+    size = box * box
+    digits = rng.sample(range(1, size + 1), size)
+    rows = [band * box + r for band in rng.sample(range(box), box)
+            for r in rng.sample(range(box), box)]
+    columns = [stack * box + c for stack in rng.sample(range(box), box)
+               for c in rng.sample(range(box), box)]
+    base = SOLVED[box]
+    return [digits[base[r * size + c] - 1] for r in rows for c in columns]
+
+
+def check_supported(difficulty, box):
+    '''Raises ValueError unless puzzles of difficulty can be made for box
+    size box.'''
+    if box not in HARDEST:
+        raise ValueError("Boxes of {0} aren't supported, only {1}".format(
+            box, ', '.join(map(str, sorted(HARDEST)))))
+    if DIFFICULTIES.index(difficulty) > DIFFICULTIES.index(HARDEST[box]):
+        raise ValueError("{0}x{0} puzzles only go up to {1}".format(
+            box * box, HARDEST[box]))
+
+
+def make_puzzle(difficulty, box=3, rng=random):
+    '''Returns (puzzle, difficulty): a unique puzzle as flat cells, of the
+    given difficulty or, failing ATTEMPTS times, the hardest one made.'''
+    check_supported(difficulty, box)
+    target = DIFFICULTIES.index(difficulty)
+    best, best_rank = None, -1
+    for _ in range(ATTEMPTS):
+        board = solved_board(box, rng)
+        puzzle = list(board)
+        rank = 0
+        blank, max_blank = 0, MAX_BLANK[box] * len(board)
+        for i in rng.sample(range(len(board)), len(board)):
+            if blank >= max_blank:
+                break
+            puzzle[i] = 0
+            graded = grade(puzzle)
+            if graded is None or DIFFICULTIES.index(graded) > target:
+                puzzle[i] = board[i]
+            else:
+                rank = DIFFICULTIES.index(graded)
+                blank += 1
+        if rank == target:
+            return puzzle, difficulty
+        if rank > best_rank:
+            best, best_rank = puzzle, rank
+    return best, DIFFICULTIES[best_rank]
+
+
+def make_puzzles(difficulty, box, count, seed):
+    '''Worker: returns count (puzzle line, difficulty) pairs.'''
+    rng = random.Random(seed)
+    puzzles = []
+    for _ in range(count):
+        puzzle, graded = make_puzzle(difficulty, box, rng)
+        puzzles.append((format_board(puzzle), graded))
+    return puzzles
+
+
+def generate(count, difficulty, box=3, workers=None, chunk_size=20,
+             seed=None):
+    '''Yields count (puzzle line, difficulty) pairs, made across workers
+    processes in chunks of chunk_size.'''
+    check_supported(difficulty, box)
+    workers = workers or os.cpu_count() or 1
+    seed = random.randrange(2 ** 32) if seed is None else seed
+    chunks = [min(chunk_size, count - start)
+              for start in range(0, count, chunk_size)]
+    with ProcessPoolExecutor(workers) as pool:
+        pending = collections.deque()
+        for n, size in enumerate(chunks):
+            pending.append(pool.submit(make_puzzles, difficulty, box, size,
+                                       "{0}-{1}".format(seed, n)))
+            if len(pending) >= 2 * workers:
+                for puzzle in pending.popleft().result():
+                    yield puzzle
+        while pending:
+            for puzzle in pending.popleft().result():
+                yield puzzle
+
+
+def cache_path(difficulty, box=3, directory=CACHE_DIR):
+    size = box * box
+    return os.path.join(directory, '{0}x{0}-{1}.txt'.format(size, difficulty))
+
+
+def add_to_cache(puzzles, box=3, directory=CACHE_DIR):
+    '''Appends (puzzle line, difficulty) pairs to their cache files.
+    Returns the counts added by difficulty.'''
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    by_difficulty = collections.defaultdict(list)
+    for line, difficulty in puzzles:
+        by_difficulty[difficulty].append(line)
+    for difficulty, lines in by_difficulty.items():
+        with open(cache_path(difficulty, box, directory), 'a') as out:
+            out.write(''.join(line + '\n' for line in lines))
+    return {difficulty: len(lines)
+            for difficulty, lines in by_difficulty.items()}
+
+
+def load_puzzle(difficulty, box=3, directory=CACHE_DIR, rng=random):
+    '''Returns a random cached puzzle line of the given difficulty. If
+    there is none yet, makes one (and caches it) on the spot, warning if
+    it only got an easier one.'''
+    path = cache_path(difficulty, box, directory)
+    if os.path.exists(path):
+        with open(path, 'rb') as cached:
+            lines = cached.read().split()
+        if lines:
+            return rng.choice(lines).decode('ascii')
+    for _ in range(LOAD_ATTEMPTS):
+        puzzle, graded = make_puzzle(difficulty, box, rng)
+        line = format_board(puzzle)
+        # Misses are still good puzzles for their own difficulty
+        add_to_cache([(line, graded)], box, directory)
+        if graded == difficulty:
+            return line
+    sys.stderr.write("No {0} puzzle came out, using a {1} one; fill the "
+                     "cache w/ generator.py\n".format(difficulty, graded))
+    return line
+
+
+def cache_stats(directory=CACHE_DIR):
+    '''Returns the number of puzzles in each cache file, by file name.'''
+    if not os.path.isdir(directory):
+        return {}
+    stats = {}
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name), 'rb') as cached:
+            stats[name] = len(cached.read().split())
+    return stats
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--difficulty', choices=DIFFICULTIES, default='hard')
+    parser.add_argument('--count', type=int, default=100,
+                        help='Puzzles to add to the cache')
+    parser.add_argument('--box', type=int, default=3,
+                        choices=sorted(HARDEST),
+                        help='Box size: 3 for 9x9, 4 for 16x16, 5 for 25x25')
+    parser.add_argument('--workers', type=int,
+                        help='Worker processes (default: one per core)')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--stats', action='store_true',
+                        help='Just show what the cache holds')
+    opts = parser.parse_args()
+    try:
+        check_supported(opts.difficulty, opts.box)
+    except ValueError as exc:
+        parser.error(str(exc))
+    return opts
+
+
+if __name__ == "__main__":
+    opts = parse_args()
+    if not opts.stats:
+        start = time.time()
+        added = collections.Counter()
+        batch = []
+        for puzzle in generate(opts.count, opts.difficulty, opts.box,
+                               opts.workers, seed=opts.seed):
+            batch.append(puzzle)
+            # Cache as we go, so an interrupted run keeps its puzzles
+            if len(batch) == 100:
+                added.update(add_to_cache(batch, opts.box, opts.cache_dir))
+                batch = []
+        added.update(add_to_cache(batch, opts.box, opts.cache_dir))
+        elapsed = time.time() - start
+        sys.stderr.write("{0:,} puzzles in {1:.1f} s ({2:,.1f}/s): {3}\n"
+                         .format(opts.count, elapsed, opts.count / elapsed,
+                                 ", ".join("{0} {1}".format(d, added[d])
+                                           for d in DIFFICULTIES
+                                           if added[d])))
+    for name, count in cache_stats(opts.cache_dir).items():
+        print("{0:20} {1:8,}".format(name, count))
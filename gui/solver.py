@@ -0,0 +1,338 @@
+'''
+Sudoku solver engine for sudoku.py boards.
+
+Boards are rows of ints (or any flat sequence of cells), 0 for empty, of
+any size w/ square boxes: 4x4, 9x9, 16x16, 25x25, ... The default method
+keeps a bitmask of used digits per row, column and box, fills naked and
+hidden singles until stuck, then guesses on the cell w/ the fewest
+candidates (MRV), or the digit w/ the fewest places in a unit if that is
+fewer. method='dlx' solves it as an exact cover problem w/ Algorithm X
+instead.
+
+    solution = solve(board)
+    unique = count_solutions(board, limit=2) == 1
+'''
+
+try:
+    popcount = int.bit_count
+except AttributeError:
+    def popcount(mask):
+        return bin(mask).count('1')
+
+
+class Geometry(object):
+    '''Cell and unit tables for boards of box x box boxes, i.e. box**2
+    digits per unit and box**4 cells. Digit d is bit d - 1; units are the
+    rows, then the columns, then the boxes.'''
+
+    def __init__(self, box):
+        self.box = box
+        self.digits = size = box * box
+        self.cells = size * size
+        self.all = (1 << size) - 1
+        self.bit = [0] + [1 << d for d in range(size)]
+        self.digit = {1 << d: d + 1 for d in range(size)}
+        self.units_of = [(i // size, size + i % size,
+                          2 * size + (i // size // box) * box +
+                          i % size // box)
+                         for i in range(self.cells)]
+        self.units = [[] for _ in range(3 * size)]
+        for i, units in enumerate(self.units_of):
+            for unit in units:
+                self.units[unit].append(i)
+        self._cover = None
+
+    def rows(self, cells):
+        size = self.digits
+        return [list(cells[i:i + size]) for i in range(0, self.cells, size)]
+
+    @property
+    def cover(self):
+        '''Exact cover form: (cover, constraints). cover maps each (cell,
+        digit) choice to the 4 constraints it meets - the cell is filled,
+        and the digit appears in its row, column and box; constraints maps
+        each constraint to the choices meeting it.'''
+        if self._cover is None:
+            size, cells = self.digits, self.cells
+            cover = {(i, d): (i,
+                              cells + self.units_of[i][0] * size + d - 1,
+                              cells + self.units_of[i][1] * size + d - 1,
+                              cells + self.units_of[i][2] * size + d - 1)
+                     for i in range(cells) for d in range(1, size + 1)}
+            constraints = {}
+            for choice, columns in cover.items():
+                for column in columns:
+                    constraints.setdefault(column, set()).add(choice)
+            self._cover = cover, constraints
+        return self._cover
+
+
+GEOMETRIES = {}
+
+
+def geometry(box):
+    '''Returns the (shared) Geometry for boxes of box x box.'''
+    if box not in GEOMETRIES:
+        GEOMETRIES[box] = Geometry(box)
+    return GEOMETRIES[box]
+
+
+def box_size(cells):
+    '''Returns the box size of a board w/ cells cells.'''
+    box = int(round(cells ** 0.25))
+    if box < 2 or box ** 4 != cells:
+        raise ValueError("A board has box**4 cells (16, 81, 256, ...), "
+                         "not {0}".format(cells))
+    return box
+
+
+def flatten(board):
+    '''Returns board (rows, or flat) as a flat list of ints.'''
+    cells = []
+    for row in board:
+        if isinstance(row, int):
+            cells.append(row)
+        else:
+            cells.extend(row)
+    box_size(len(cells))
+    return cells
+
+
+class SudokuSolver(object):
+    '''Bitmask constraint propagation + MRV backtracking. Counts the
+    singles it placed and the guesses it made, for grading.'''
+
+    def __init__(self, board):
+        self.cells = flatten(board)
+        self.geometry = geometry(box_size(len(self.cells)))
+        self.naked_singles = 0
+        self.hidden_singles = 0
+        self.guesses = 0
+
+    def solve(self):
+        '''Returns the first solution as rows, or None if there is none.'''
+        solutions = self.search(1)
+        return self.geometry.rows(solutions[0]) if solutions else None
+
+    def count_solutions(self, limit=2):
+        '''Counts solutions, stopping once limit are found.'''
+        return len(self.search(limit))
+
+    def search(self, limit):
+        '''Returns up to limit solutions, as flat lists.'''
+        geo = self.geometry
+        cells = list(self.cells)
+        used = [0] * (3 * geo.digits)
+        for i, digit in enumerate(cells):
+            if digit:
+                if not 1 <= digit <= geo.digits or \
+                        not place(geo, cells, used, i, geo.bit[digit]):
+                    return []
+        solutions = []
+        self.backtrack(cells, used, limit, solutions)
+        return solutions
+
+    def backtrack(self, cells, used, limit, solutions):
+        if not self.propagate(cells, used):
+            return
+        geo = self.geometry
+        full, units_of = geo.all, geo.units_of
+        best, best_count, best_mask = None, geo.digits + 1, 0
+        for i in range(geo.cells):
+            if not cells[i]:
+                r, c, b = units_of[i]
+                mask = full & ~(used[r] | used[c] | used[b])
+                count = popcount(mask)
+                if count < best_count:
+                    best, best_count, best_mask = i, count, mask
+                    if count == 2:
+                        break
+        if best is None:
+            solutions.append(cells)
+            return
+        moves = [(best, bit) for bit in bits(best_mask)]
+        if best_count > 2:
+            # On sparse boards a digit may have fewer places left in some
+            # unit than any cell has candidates; branch on those instead
+            moves = self.fewest_places(cells, used, moves)
+        for i, bit in moves:
+            self.guesses += 1
+            branch, branch_used = list(cells), list(used)
+            place(geo, branch, branch_used, i, bit)
+            self.backtrack(branch, branch_used, limit, solutions)
+            if len(solutions) >= limit:
+                return
+
+    def fewest_places(self, cells, used, moves):
+        geo = self.geometry
+        full, units_of = geo.all, geo.units_of
+        for u, unit in enumerate(geo.units):
+            free = full & ~used[u]
+            if not free:
+                continue
+            masks = []
+            for i in unit:
+                if not cells[i]:
+                    r, c, b = units_of[i]
+                    masks.append((i, full & ~(used[r] | used[c] | used[b])))
+            for bit in bits(free):
+                places = [(i, bit) for i, mask in masks if mask & bit]
+                if len(places) < len(moves):
+                    moves = places
+                    if len(moves) == 2:
+                        return moves
+        return moves
+
+    def propagate(self, cells, used):
+        '''Places naked and hidden singles until there are none left.
+        Returns False if the board turns out to be unsolvable.'''
+        geo = self.geometry
+        full, units_of = geo.all, geo.units_of
+        progress = True
+        while progress:
+            progress = False
+            # Naked singles: cells w/ one candidate left
+            for i in range(geo.cells):
+                if not cells[i]:
+                    r, c, b = units_of[i]
+                    mask = full & ~(used[r] | used[c] | used[b])
+                    if not mask:
+                        return False
+                    if not mask & (mask - 1):
+                        place(geo, cells, used, i, mask)
+                        self.naked_singles += 1
+                        progress = True
+            if progress:
+                continue
+            # Hidden singles: digits w/ one place left in a unit, looked
+            # for only once naked singles run out so the counts grade
+            # which technique a puzzle needs
+            for u, unit in enumerate(geo.units):
+                once = twice = 0
+                for i in unit:
+                    if not cells[i]:
+                        r, c, b = units_of[i]
+                        mask = full & ~(used[r] | used[c] | used[b])
+                        twice |= once & mask
+                        once |= mask
+                if once | used[u] != full:
+                    return False
+                hidden = once & ~twice
+                while hidden:
+                    bit = hidden & -hidden
+                    hidden ^= bit
+                    for i in unit:
+                        if not cells[i]:
+                            r, c, b = units_of[i]
+                            if bit & ~(used[r] | used[c] | used[b]):
+                                place(geo, cells, used, i, bit)
+                                break
+                    else:
+                        return False
+                    self.hidden_singles += 1
+                    progress = True
+        return True
+
+
+def bits(mask):
+    '''Splits mask into its set bits, lowest first.'''
+    while mask:
+        bit = mask & -mask
+        yield bit
+        mask ^= bit
+
+
+def place(geo, cells, used, i, bit):
+    '''Puts the digit for bit in cell i. Returns False if a peer has it.'''
+    r, c, b = geo.units_of[i]
+    if (used[r] | used[c] | used[b]) & bit:
+        return False
+    cells[i] = geo.digit[bit]
+    used[r] |= bit
+    used[c] |= bit
+    used[b] |= bit
+    return True
+
+
+class DLXSolver(object):
+    '''Algorithm X on the exact cover form of the board, w/ dicts of sets
+    standing in for dancing links.'''
+
+    def __init__(self, board):
+        self.cells = flatten(board)
+        self.geometry = geometry(box_size(len(self.cells)))
+        self.guesses = 0
+
+    def solve(self):
+        solutions = self.search(1)
+        return self.geometry.rows(solutions[0]) if solutions else None
+
+    def count_solutions(self, limit=2):
+        return len(self.search(limit))
+
+    def search(self, limit):
+        cover, constraints = self.geometry.cover
+        columns = {column: set(choices)
+                   for column, choices in constraints.items()}
+        chosen = []
+        for i, digit in enumerate(self.cells):
+            if digit:
+                if (i, digit) not in cover or \
+                        (i, digit) not in columns[cover[(i, digit)][0]]:
+                    return []
+                select(cover, columns, (i, digit))
+                chosen.append((i, digit))
+        solutions = []
+        self.cover(cover, columns, chosen, limit, solutions)
+        return solutions
+
+    def cover(self, cover, columns, chosen, limit, solutions):
+        if not columns:
+            cells = list(self.cells)
+            for i, digit in chosen:
+                cells[i] = digit
+            solutions.append(cells)
+            return
+        column = min(columns, key=lambda c: len(columns[c]))
+        for choice in list(columns[column]):
+            self.guesses += 1
+            chosen.append(choice)
+            removed = select(cover, columns, choice)
+            self.cover(cover, columns, chosen, limit, solutions)
+            deselect(cover, columns, choice, removed)
+            chosen.pop()
+            if len(solutions) >= limit:
+                return
+
+
+def select(cover, columns, choice):
+    removed = []
+    for column in cover[choice]:
+        for other in columns[column]:
+            for other_column in cover[other]:
+                if other_column != column:
+                    columns[other_column].discard(other)
+        removed.append(columns.pop(column))
+    return removed
+
+
+def deselect(cover, columns, choice, removed):
+    for column in reversed(cover[choice]):
+        columns[column] = removed.pop()
+        for other in columns[column]:
+            for other_column in cover[other]:
+                if other_column != column:
+                    columns[other_column].add(other)
+
+
+SOLVERS = {'propagate': SudokuSolver, 'dlx': DLXSolver}
+
+
+def solve(board, method='propagate'):
+    '''Returns a solution of board as rows, or None if it has none.'''
+    return SOLVERS[method](board).solve()
+
+
+def count_solutions(board, limit=2, method='propagate'):
+    '''Counts board's solutions, up to limit.'''
+    return SOLVERS[method](board).count_solutions(limit)
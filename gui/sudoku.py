@@ -1,94 +1,156 @@
 import argparse
 from tkinter import BOTH, BOTTOM, TOP, Button, Canvas, Frame, Tk
 
+import generator
+import solver
+from board import (CELL_CHARS, CELL_VALUES, SudokuError, format_board,
+                   parse_board, read_boards)
+
 BOARDS = ['debug', 'n00b', 'l33t', 'error']
 MARGIN = 20
 SIDE = 50
-WIDTH = HEIGHT = MARGIN * 2 + SIDE * 9
-
-
-class SudokuError(Exception):
-    '''An application-specific error.'''
-    pass
+# Cells shrink on boards bigger than 9x9, down to MIN_SIDE
+MIN_SIDE = 28
 
 
 class SudokuBoard(object):
-    '''Sudoku Board representation'''
+    '''Sudoku Board representation. cells holds the size x size cells row
+    by row in a bytearray, 0 for empty; squares are box x box.'''
 
     def __init__(self, board_file):
-        self.board = __create_board(board_file)
+        self.cells = self.__create_board(board_file)
+        self.box = solver.box_size(len(self.cells))
+        self.size = self.box * self.box
+
+    @property
+    def board(self):
+        '''The board as rows of ints.'''
+        size = self.size
+        return [list(self.cells[i:i + size])
+                for i in range(0, len(self.cells), size)]
+
+    def solve(self, method='propagate'):
+        '''Returns a solution as rows of ints, or None if there is none.
+        method is 'propagate' or 'dlx', see solver.py.'''
+        return solver.solve(self.cells, method)
+
+    def count_solutions(self, limit=2, method='propagate'):
+        '''Counts solutions, stopping at limit; 1 means the puzzle is
+        proper.'''
+        return solver.count_solutions(self.cells, limit, method)
 
     def __create_board(self, board_file):
-        board = []
-        for line in board_file:
-            line = line.strip()
-            if len(line) != 9:
-                board = []
-                raise SudokuError(
-                    "Each line in the Sudoku board must be 9 chars long."
-                )
-            board.append([])
-            for c in line:
-                if not c.isdigit():
-                    raise SudokuError(
-                        "Valid characters for a Sudoku puzzle must be in 0-9."
-                    )
-                board[-1].append(int(c))
-        if len(board) != 9:
-            raise SudokuError(
-                "Each Sudoku puzzle must be 9 lines long."
-            )
-        return board
+        if isinstance(board_file, (str, bytes, bytearray)):
+            return parse_board(board_file)
+        return parse_board(board_file.read())
 
 
 class SudokuGame(object):
     '''A Sudoku game, in charge of storying the state of the board and
-    checking whether the puzzle is completed.'''
+    checking whether the puzzle is completed.
+
+    puzzle is a flat bytearray of the size * size cells, so starting or
+    restoring a game is one copy. Moves go through set_cell, which keeps a
+    count of each digit per row, column and square, so checking a move or
+    the win is O(1), and records the move for undo.'''
 
     def __init__(self, board_file):
         self.board_file = board_file
-        self.start_puzzle = SudokuBoard(board_file).board
+        board = SudokuBoard(board_file)
+        self.start_puzzle = bytes(board.cells)
+        self.box = board.box
+        self.size = board.size
 
     def start(self):
         self.game_over = False
-        self.puzzle = []
-        for i in xrange(9):
-            self.puzzle.append([])
-            for j in xrange(9):
-                self.puzzle[i].append(self.start_puzzle[i][j])
+        self.puzzle = bytearray(self.start_puzzle)
+        self.history = []
+        self.__recount()
+
+    def get_cell(self, row, column):
+        return self.puzzle[row * self.size + column]
+
+    def set_cell(self, row, column, value):
+        '''Puts value (1 to size, or 0 to clear) in a cell of the puzzle.'''
+        i = row * self.size + column
+        if self.start_puzzle[i]:
+            raise SudokuError("Can't change the puzzle's given numbers.")
+        if not 0 <= value <= self.size:
+            raise SudokuError("Valid Sudoku numbers are 1-{0}, 0 to "
+                              "clear.".format(self.size))
+        self.history.append((i, self.puzzle[i]))
+        self.__set(row, column, value)
+
+    def undo(self):
+        '''Takes back the last move. Returns its (row, column), or None if
+        there is nothing to undo.'''
+        if not self.history:
+            return None
+        i, value = self.history.pop()
+        row, column = divmod(i, self.size)
+        self.__set(row, column, value)
+        return row, column
+
+    def snapshot(self):
+        '''Returns the current puzzle (size * size bytes) for restore().'''
+        return bytes(self.puzzle)
+
+    def restore(self, snapshot):
+        self.puzzle[:] = snapshot
+        self.history = []
+        self.__recount()
+
+    def is_conflict(self, row, column):
+        '''Whether the cell's number also appears in its row, column or
+        square.'''
+        value = self.puzzle[row * self.size + column]
+        return bool(value) and any(self.counts[unit][value] > 1
+                                   for unit in self.__units(row, column))
+
+    def is_valid(self):
+        '''Whether no row, column or square has a number twice.'''
+        return not self.duplicates
 
     def check_win(self):
-        for row in xrange(9):
-            if not self.__check_row(row):
-                return False
-        for column in xrange(9):
-            if not self.__check_column(column):
-                return False
-        for row in xrange(3):
-            for column in xrange(3):
-                if not self.__check_square(row, column):
-                    return False
-        self.game_over = True
-        return True
-
-    def __check_block(self, block):
-        return set(block) == set(range(1, 10))
-
-    def __check_row(self, row):
-        return self.__check_block(self.puzzle[row])
-
-    def __check_column(self, column):
-        return self.__check_block(
-            [self.puzzle[row][column] for row in xrange(9)]
-        )
-
-    def __check_square(self, row, column):
-        return self.__check_block(
-            [self.puzzle[r][c]
-             for r in xrange(row * 3, (row + 1) * 3)
-             for c in xrange(column * 3, (column + 1) * 3)
-             ]
-        )
+        # A full board w/o repeats has every number in every row, column
+        # and square
+        if self.filled == len(self.puzzle) and not self.duplicates:
+            self.game_over = True
+            return True
+        return False
+
+    def __set(self, row, column, value):
+        i = row * self.size + column
+        old = self.puzzle[i]
+        if old:
+            self.__count(row, column, old, -1)
+        self.puzzle[i] = value
+        if value:
+            self.__count(row, column, value, 1)
+
+    def __recount(self):
+        # counts[unit][digit]; units are rows, then columns, then squares
+        self.counts = [[0] * (self.size + 1) for _ in range(3 * self.size)]
+        self.filled = 0
+        self.duplicates = 0
+        for i, value in enumerate(self.puzzle):
+            if value:
+                row, column = divmod(i, self.size)
+                self.__count(row, column, value, 1)
+
+    def __units(self, row, column):
+        size, box = self.size, self.box
+        return (row, size + column,
+                2 * size + row // box * box + column // box)
+
+    def __count(self, row, column, value, delta):
+        self.filled += delta
+        for unit in self.__units(row, column):
+            counts = self.counts[unit]
+            # A digit's first copy in a unit isn't a duplicate
+            if delta > 0 and counts[value] or delta < 0 and counts[value] > 1:
+                self.duplicates += delta
+            counts[value] += delta
 
 
 class SudokuUI(Frame):
@@ -97,13 +159,16 @@ class SudokuUI(Frame):
         self.game = game
         self.parent = parent
         Frame.__init__(self, parent)
-        self.row, self.col = 0, 0
+        self.row, self.col = -1, -1
+        self.size = game.size
+        self.side = max(SIDE * 9 // self.size, MIN_SIDE)
+        self.width = self.height = MARGIN * 2 + self.side * self.size
         self.__initUI()
 
     def __initUI(self):
         self.parent.title("Sudoku")
         self.pack(fill=BOTH, expand=1)
-        self.canvas = Canvas(self, width=WIDTH, height=HEIGHT)
+        self.canvas = Canvas(self, width=self.width, height=self.height)
         self.canvas.pack(fill=BOTH, side=TOP)
         clear_button = Button(self, text='Clear answers',
                               command=self.__clear_answers)
@@ -114,10 +179,171 @@ class SudokuUI(Frame):
         self.canvas.bind("<Key>", self.__key_pressed)
 
     def __draw_grid(self):
-        '''Draws grid divided with blue lines into 3x3 squares'''
-        for i in xrange(10):
-            color = 'blue' if i % 3 == 0 else 'gray'
-            x0 = MARGIN + i * SIDE
+        '''Draws grid divided with blue lines into squares'''
+        for i in range(self.size + 1):
+            color = 'blue' if i % self.game.box == 0 else 'gray'
+            x0 = MARGIN + i * self.side
             y0 = MARGIN
-            x1 = MARGIN + i * SIDE
-            y1 = HEIGHT - MARGIN
+            x1 = MARGIN + i * self.side
+            y1 = self.height - MARGIN
+            self.canvas.create_line(x0, y0, x1, y1, fill=color)
+
+            x0 = MARGIN
+            y0 = MARGIN + i * self.side
+            x1 = self.width - MARGIN
+            y1 = MARGIN + i * self.side
+            self.canvas.create_line(x0, y0, x1, y1, fill=color)
+
+    def __draw_puzzle(self):
+        '''Creates one text item per cell, and the (hidden) cursor. Moves
+        then only reconfigure the items that change.'''
+        self.canvas.delete("numbers", "cursor")
+        self.cells = []
+        self.shown = []
+        for i in range(self.size * self.size):
+            row, col = divmod(i, self.size)
+            x = MARGIN + col * self.side + self.side // 2
+            y = MARGIN + row * self.side + self.side // 2
+            self.cells.append(self.canvas.create_text(x, y, text='',
+                                                      tags="numbers"))
+            self.shown.append(('', 'black'))
+        self.cursor = self.canvas.create_rectangle(
+            0, 0, 0, 0, outline='red', tags="cursor", state='hidden')
+        self.redraw()
+
+    def redraw(self):
+        '''Brings every cell up to date w/ the game.'''
+        for i in range(self.size * self.size):
+            self.__draw_cell(i)
+
+    def update_cell(self, row, col):
+        '''Redraws a cell after a move, and its row, column and square
+        since their conflicts may have changed.'''
+        geo = solver.geometry(self.game.box)
+        for unit in geo.units_of[row * self.size + col]:
+            for i in geo.units[unit]:
+                self.__draw_cell(i)
+
+    def __draw_cell(self, i):
+        row, col = divmod(i, self.size)
+        answer = self.game.get_cell(row, col)
+        if not answer:
+            shown = ('', 'black')
+        elif self.game.is_conflict(row, col):
+            shown = (CELL_CHARS[answer], 'red')
+        elif self.game.start_puzzle[i]:
+            shown = (CELL_CHARS[answer], 'black')
+        else:
+            shown = (CELL_CHARS[answer], 'sea green')
+        # Tk redraws any item that's touched, so leave unchanged ones be
+        if shown != self.shown[i]:
+            self.shown[i] = shown
+            self.canvas.itemconfigure(self.cells[i], text=shown[0],
+                                      fill=shown[1])
+
+    def __draw_cursor(self):
+        if self.row >= 0 and self.col >= 0:
+            x0 = MARGIN + self.col * self.side + 1
+            y0 = MARGIN + self.row * self.side + 1
+            x1 = MARGIN + (self.col + 1) * self.side - 1
+            y1 = MARGIN + (self.row + 1) * self.side - 1
+            self.canvas.coords(self.cursor, x0, y0, x1, y1)
+            self.canvas.itemconfigure(self.cursor, state='normal')
+        else:
+            self.canvas.itemconfigure(self.cursor, state='hidden')
+
+    def __draw_victory(self):
+        # create an oval (which will be a circle) over the middle squares
+        center = MARGIN + self.side * self.size // 2
+        radius = self.side * self.size * 5 // 18
+        self.canvas.create_oval(center - radius, center - radius,
+                                center + radius, center + radius,
+                                tags="victory", fill='dark orange',
+                                outline='orange')
+        self.canvas.create_text(center, center, text="You win!",
+                                tags="victory", fill='white',
+                                font=('Arial', 32))
+
+    def __cell_clicked(self, event):
+        if self.game.game_over:
+            return
+        x, y = event.x, event.y
+        if (MARGIN < x < self.width - MARGIN and
+                MARGIN < y < self.height - MARGIN):
+            self.canvas.focus_set()
+            row = (y - MARGIN) // self.side
+            col = (x - MARGIN) // self.side
+            # if cell was selected already - deselect it
+            if (row, col) == (self.row, self.col):
+                self.row, self.col = -1, -1
+            elif self.game.start_puzzle[row * self.size + col] == 0:
+                self.row, self.col = row, col
+        else:
+            self.row, self.col = -1, -1
+        self.__draw_cursor()
+
+    def __key_pressed(self, event):
+        if self.game.game_over:
+            return
+        if self.row >= 0 and self.col >= 0 and len(event.char) == 1:
+            code = ord(event.char)
+            # Only Latin-1 keys are in the table; folding others onto it
+            # would turn e.g. U+0131 into a 1
+            value = CELL_VALUES[code] if code < 256 else 255
+            if value > self.size:
+                return
+            self.game.set_cell(self.row, self.col, value)
+            self.update_cell(self.row, self.col)
+            self.col, self.row = -1, -1
+            self.__draw_cursor()
+            if self.game.check_win():
+                self.__draw_victory()
+
+    def __clear_answers(self):
+        self.game.start()
+        self.canvas.delete("victory")
+        self.redraw()
+
+
+def parse_arguments():
+    arg_parser = argparse.ArgumentParser()
+    board = arg_parser.add_mutually_exclusive_group(required=True)
+    board.add_argument("--board", help="Desired board name",
+                       type=str, choices=BOARDS)
+    board.add_argument("--file",
+                       help="Board file: N lines of N chars, or one line")
+    board.add_argument("--difficulty",
+                       choices=generator.DIFFICULTIES,
+                       help="A fresh puzzle from generator.py's cache")
+    arg_parser.add_argument("--box", type=int, default=3,
+                            choices=sorted(generator.HARDEST),
+                            help="Box size of --difficulty puzzles: 3 for "
+                                 "9x9, 4 for 16x16, 5 for 25x25")
+    args = arg_parser.parse_args()
+    if args.difficulty:
+        try:
+            generator.check_supported(args.difficulty, args.box)
+        except ValueError as exc:
+            arg_parser.error(str(exc))
+    return args
+
+
+def load_game(args):
+    '''Returns a started SudokuGame for the command line args.'''
+    if args.difficulty:
+        game = SudokuGame(generator.load_puzzle(args.difficulty, args.box))
+    else:
+        board_file = args.file or '%s.sudoku' % args.board
+        with open(board_file, 'r') as boards_file:
+            game = SudokuGame(boards_file)
+    game.start()
+    return game
+
+
+if __name__ == '__main__':
+    game = load_game(parse_arguments())
+
+    root = Tk()
+    ui = SudokuUI(root, game)
+    root.geometry("%dx%d" % (ui.width, ui.height + 40))
+    root.mainloop()
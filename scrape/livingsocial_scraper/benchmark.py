@@ -0,0 +1,352 @@
+'''
+Benchmarks for the LivingSocial scraper.
+
+Runs offline against a local SQLite database (or any SQLAlchemy URL
+given w/ --db-url) and, for crawls, the fixture server in fixtures.py.
+
+    python benchmark.py pipeline --items 20000 --db-latency 0.002
+    python benchmark.py parse --deals 5000
+    python benchmark.py crawl --pages 200 --deals 50 --latency 0.05
+    python benchmark.py incremental --pages 200 --changed 0.1
+'''
+
+import argparse
+import os
+import tempfile
+import time
+
+from scrapy import signals
+from scrapy.crawler import CrawlerRunner
+from scrapy.http import HtmlResponse
+from scrapy.loader import ItemLoader
+from itemloaders.processors import Join, MapCompose
+from scrapy.selector import Selector
+from scrapy.utils.log import configure_logging
+from scrapy.utils.project import get_project_settings
+from sqlalchemy import create_engine, event, func, select
+from sqlalchemy.orm import sessionmaker
+from twisted.internet import defer, task
+
+import livingsocial.models as models
+from fixtures import make_deal_page, start_fixture_server
+from livingsocial.items import LivingSocialDeal
+from livingsocial.pipelines import LivingSocialPipeline
+from livingsocial.spiders.livingsocial_spider import LivingSocialSpider
+
+# The spider's original ItemLoader setup, kept for comparison
+LEGACY_ITEM_FIELDS = {
+    'title': './/a/div[@class="deal-details"]/h2/text()',
+    'subtitle': './/a/div[@class="deal-details"]/h3/text()',
+    'description': './/a/div[@class="deal-details"]/p[@class="description"]/text()',
+    'link': './/a/@href',
+    'location': './/a/div[@class="deal-details"]/p[@class="location"]/text()',
+    'original_price': './/a/div[@class="deal-prices"]/div[@class="deal-strikethrough-price"]/div[@class="strikethrough-wrapper"]/sup/following-sibling::text()',
+    'price': './/a/div[@class="deal-prices"]/div[@class="deal-price"]/text()'
+}
+
+
+def make_items(count):
+    '''Builds scraped deal items as the spider yields them.'''
+    return [{'title': u"Deal {0}".format(i),
+             'subtitle': u"Subtitle for deal {0}".format(i),
+             'description': u"Two-course dinner for two at place {0}".format(i),
+             'link': u"https://www.livingsocial.com/deals/{0}".format(i),
+             'location': u"Seattle",
+             'original_price': u"${0}".format(40 + i % 60),
+             'price': u"${0}.99".format(20 + i % 30)}
+            for i in range(count)]
+
+
+def fresh_engine(db_url, latency=0.0):
+    '''Returns an engine w/ an empty deals table. latency (seconds) is
+    added to every statement to mimic a round trip to a remote Postgres.'''
+    if db_url is None:
+        db_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'deals.db')
+    engine = create_engine(db_url)
+    models.DeclarativeBase.metadata.drop_all(engine)
+    models.create_tables(engine)
+    if latency:
+        event.listen(engine, 'before_cursor_execute',
+                     lambda *args: time.sleep(latency))
+    return engine
+
+
+def legacy_insert(engine, items):
+    '''The original pipeline: one session and commit per item, all on
+    the reactor thread. Returns seconds the reactor was blocked.'''
+    start = time.perf_counter()
+    Session = sessionmaker(bind=engine)
+    for item in items:
+        session = Session()
+        try:
+            session.add(models.Deal(**item))
+            session.commit()
+        finally:
+            session.close()
+    return time.perf_counter() - start
+
+
+@defer.inlineCallbacks
+def batched_insert(engine, items, batch_size):
+    '''Feeds items through LivingSocialPipeline like Scrapy does, waiting
+    on its Deferreds. Returns seconds the reactor was blocked.'''
+    blocked = 0.0
+    pipeline = LivingSocialPipeline(engine, batch_size=batch_size,
+                                    flush_interval=0)
+    pipeline.open_spider(None)
+    for item in items:
+        start = time.perf_counter()
+        result = pipeline.process_item(item, None)
+        blocked += time.perf_counter() - start
+        if isinstance(result, defer.Deferred):
+            yield result
+    yield pipeline.close_spider(None)
+    return blocked
+
+
+@defer.inlineCallbacks
+def bench_pipeline(opts):
+    items = make_items(opts.items)
+    runs = [('per-item commit', lambda e: legacy_insert(e, items))]
+    for batch_size in opts.batch_sizes:
+        runs.append(('batched x{0}'.format(batch_size),
+                     lambda e, b=batch_size: batched_insert(e, items, b)))
+    for label, run in runs:
+        engine = fresh_engine(opts.db_url, opts.db_latency)
+        start = time.perf_counter()
+        blocked = yield defer.maybeDeferred(run, engine)
+        elapsed = time.perf_counter() - start
+        with engine.connect() as conn:
+            stored = conn.execute(
+                select(func.count()).select_from(models.Deal)).scalar()
+        print("{0:16} {1:8,} rows {2:7.2f} s ({3:,.0f} rows/s), "
+              "reactor blocked {4:6.2f} s".format(
+                  label, stored, elapsed, stored / elapsed, blocked))
+        engine.dispose()
+
+
+def legacy_parse(response):
+    selector = Selector(response=response)
+    for deal in selector.xpath('//li[@dealid]'):
+        loader = ItemLoader(LivingSocialDeal(), deal)
+        loader.default_input_processor = MapCompose(str.strip)
+        loader.default_output_processor = Join()
+        for field, xpath in LEGACY_ITEM_FIELDS.items():
+            loader.add_xpath(field, xpath)
+        yield loader.load_item()
+
+
+def bench_parse(opts):
+    if opts.fixture:
+        with open(opts.fixture, 'rb') as fp:
+            body = fp.read()
+    else:
+        body = make_deal_page(opts.deals).encode('utf-8')
+    url = 'https://www.livingsocial.com/cities/27-seattle'
+    spider = LivingSocialSpider()
+    results = {}
+    for label, parse in (('ItemLoader', legacy_parse),
+                         ('compiled XPath', spider.parse)):
+        best = None
+        for _ in range(opts.repeat):
+            # Fresh response each time so the parsed tree isn't reused
+            response = HtmlResponse(url, body=body, encoding='utf-8')
+            start = time.perf_counter()
+            items = [dict(item) for item in parse(response)]
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[label] = items
+        print("{0:15} {1:6,} deals {2:8.1f} ms ({3:,.0f} deals/s)".format(
+            label, len(items), best * 1e3, len(items) / best))
+    same = results['ItemLoader'] == results['compiled XPath']
+    print("Items identical:", same)
+
+
+class TimedSpider(LivingSocialSpider):
+    '''LivingSocialSpider adding time spent in parse to the crawl stats.'''
+
+    def parse(self, response):
+        stats = self.crawler.stats
+        start = time.perf_counter()
+        for item in super(TimedSpider, self).parse(response):
+            stats.inc_value('benchmark/parse_time',
+                            time.perf_counter() - start)
+            yield item
+            start = time.perf_counter()
+        stats.inc_value('benchmark/parse_time', time.perf_counter() - start)
+
+
+class TimedPipeline(LivingSocialPipeline):
+    '''LivingSocialPipeline adding time spent in process_item (on the
+    reactor) and in db writes (writer thread) to the crawl stats.'''
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        pipeline = super(TimedPipeline, cls).from_crawler(crawler)
+        pipeline.stats = crawler.stats
+        return pipeline
+
+    def process_item(self, item, spider):
+        start = time.perf_counter()
+        try:
+            return super(TimedPipeline, self).process_item(item, spider)
+        finally:
+            self.stats.inc_value('benchmark/pipeline_time',
+                                 time.perf_counter() - start)
+
+    def write(self, rows):
+        start = time.perf_counter()
+        try:
+            super(TimedPipeline, self).write(rows)
+        finally:
+            self.stats.inc_value('benchmark/write_time',
+                                 time.perf_counter() - start)
+
+
+@defer.inlineCallbacks
+def run_crawl(server, db_url, opts, **overrides):
+    '''Crawls every page of the fixture server into db_url. Returns
+    (seconds, crawl stats, download latency of each response).'''
+    settings = get_project_settings()
+    settings.setdict({
+        'DATABASE_URL': db_url,
+        'ITEM_PIPELINES': {TimedPipeline: 100},
+        'CONCURRENT_REQUESTS': opts.concurrency,
+        'CONCURRENT_REQUESTS_PER_DOMAIN': opts.concurrency,
+        # Measure the crawl itself, not politeness toward the real site
+        'AUTOTHROTTLE_ENABLED': False,
+        'ROBOTSTXT_OBEY': False,
+        'LOG_LEVEL': opts.log_level,
+        # Run on the reactor task.react already started
+        'TWISTED_REACTOR': None,
+    }, priority='cmdline')
+    settings.setdict(overrides, priority='cmdline')
+    configure_logging(settings)
+    runner = CrawlerRunner(settings)
+    crawler = runner.create_crawler(TimedSpider)
+    download = []
+
+    def response_received(response, request, spider):
+        download.append(request.meta.get('download_latency', 0.0))
+    crawler.signals.connect(response_received, signals.response_received)
+    start = time.perf_counter()
+    yield runner.crawl(crawler, base_url=server.base_url,
+                       cities='1-{0}'.format(server.pages))
+    return time.perf_counter() - start, crawler.stats.get_stats(), download
+
+
+def temp_db_url():
+    return 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'deals.db')
+
+
+@defer.inlineCallbacks
+def bench_crawl(opts):
+    server = start_fixture_server(pages=opts.pages, deals=opts.deals,
+                                  latency=opts.latency)
+    print("Fixture server at {0}: {1:,} pages x {2:,} deals, {3:.0f} ms "
+          "latency".format(server.base_url, opts.pages, opts.deals,
+                           opts.latency * 1e3))
+    try:
+        elapsed, stats, download = yield run_crawl(
+            server, opts.db_url or temp_db_url(), opts,
+            INCREMENTAL_ENABLED=False)
+    finally:
+        server.shutdown()
+    items = stats.get('item_scraped_count', 0)
+    pages = len(download)
+    print("{0:,} pages, {1:,} items in {2:.2f} s: {3:,.1f} pages/s, "
+          "{4:,.0f} items/s".format(pages, items, elapsed, pages / elapsed,
+                                    items / elapsed))
+    # Download overlaps across concurrent requests, so it can exceed wall
+    print("download   {0:8.2f} s total, {1:6.1f} ms/page".format(
+        sum(download), 1e3 * sum(download) / max(pages, 1)))
+    for label, key in (('parse', 'benchmark/parse_time'),
+                       ('pipeline', 'benchmark/pipeline_time'),
+                       ('db write', 'benchmark/write_time')):
+        spent = stats.get(key, 0.0)
+        print("{0:10} {1:8.2f} s total, {2:6.1f} us/item".format(
+            label, spent, 1e6 * spent / max(items, 1)))
+    print("rejected   {0:8,} deals".format(
+        stats.get('livingsocial/rejected', 0)))
+
+
+@defer.inlineCallbacks
+def bench_incremental(opts):
+    print("{0:,} pages x {1:,} deals, {2:.0f} ms latency, {3:.0%} of pages "
+          "change before the last crawl".format(
+              opts.pages, opts.deals, opts.latency * 1e3, opts.changed))
+    for validators in (True, False):
+        server = start_fixture_server(pages=opts.pages, deals=opts.deals,
+                                      latency=opts.latency,
+                                      validators=validators)
+        db_url = temp_db_url()
+        print("Server {0} ETag/Last-Modified".format(
+            'sends' if validators else 'without'))
+        try:
+            for label in ('first crawl', 'nothing changed', 'some changed'):
+                if label == 'some changed':
+                    server.update(opts.changed)
+                elapsed, stats, _ = yield run_crawl(server, db_url, opts)
+                print("  {0:16} {1:6.2f} s  {2:6,} parsed  {3:6,} 304s  "
+                      "{4:6,} same hash  {5:8,} items".format(
+                          label, elapsed,
+                          stats.get('incremental/changed', 0),
+                          stats.get('incremental/not_modified', 0),
+                          stats.get('incremental/unchanged', 0),
+                          stats.get('item_scraped_count', 0)))
+        finally:
+            server.shutdown()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    pipeline = commands.add_parser('pipeline',
+                                   help='Item pipeline insert throughput')
+    pipeline.add_argument('--items', type=int, default=20000)
+    pipeline.add_argument('--batch-sizes', type=int, nargs='+',
+                          default=[100, 500, 2000])
+    pipeline.add_argument('--db-url',
+                          help='SQLAlchemy URL (default: temp SQLite file)')
+    pipeline.add_argument('--db-latency', type=float, default=0.0,
+                          help='Seconds added to every statement')
+    pipeline.set_defaults(func=bench_pipeline)
+    parse = commands.add_parser('parse', help='Spider extraction speed')
+    parse.add_argument('--deals', type=int, default=5000,
+                       help='Deals on the generated page')
+    parse.add_argument('--fixture', help='Saved HTML page to parse instead')
+    parse.add_argument('--repeat', type=int, default=3)
+    parse.set_defaults(func=bench_parse)
+    crawl = commands.add_parser('crawl',
+                                help='Full crawl against the fixture server')
+    crawl.add_argument('--pages', type=int, default=200,
+                       help='City pages to crawl')
+    crawl.add_argument('--deals', type=int, default=50,
+                       help='Deals per page')
+    crawl.add_argument('--latency', type=float, default=0.05,
+                       help='Server latency per request in seconds')
+    crawl.add_argument('--concurrency', type=int, default=16)
+    crawl.add_argument('--db-url',
+                       help='SQLAlchemy URL (default: temp SQLite file)')
+    crawl.add_argument('--log-level', default='WARNING')
+    crawl.set_defaults(func=bench_crawl)
+    incremental = commands.add_parser('incremental',
+                                      help='Repeat crawls w/ conditional '
+                                           'requests and content hashes')
+    incremental.add_argument('--pages', type=int, default=200)
+    incremental.add_argument('--deals', type=int, default=50)
+    incremental.add_argument('--latency', type=float, default=0.05)
+    incremental.add_argument('--changed', type=float, default=0.1,
+                             help='Fraction of pages changed before the '
+                                  'last crawl')
+    incremental.add_argument('--concurrency', type=int, default=16)
+    incremental.add_argument('--log-level', default='WARNING')
+    incremental.set_defaults(func=bench_incremental)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    opts = parse_args()
+    # Benchmarks run inside the Twisted reactor, like a crawl does
+    task.react(lambda reactor: defer.maybeDeferred(opts.func, opts))
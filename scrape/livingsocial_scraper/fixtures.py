@@ -0,0 +1,223 @@
+'''
+Synthetic livingsocial.com city pages for offline benchmarks.
+
+The markup follows the deal list the spider scrapes (li[@dealid] w/
+deal-details and deal-prices blocks), padded w/ the kind of surrounding
+page chrome a real city page has.
+
+    python fixtures.py page --deals 5000 seattle.html
+    python fixtures.py serve --pages 300 --deals 50 --latency 0.05
+
+serve replays city pages /cities/1 ... /cities/<pages> over HTTP, so a
+real crawl can run w/o livingsocial.com:
+
+    scrapy crawl livingsocial -a base_url=http://127.0.0.1:8000 -a cities=1-300
+'''
+
+import argparse
+import re
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CITY_PATH = re.compile(r'^/cities/(\d+)(-[\w-]+)?$')
+
+PAGE = u'''<!DOCTYPE html>
+<html>
+<head><title>Daily Deals in {city} | LivingSocial</title></head>
+<body>
+<div id="header"><ul class="nav">{nav}</ul></div>
+<div id="content">
+<ul class="deals">
+{deals}
+</ul>
+</div>
+<div id="footer"><p>LivingSocial</p></div>
+</body>
+</html>
+'''
+
+DEAL = u'''<li dealid="{id}" class="deal">
+  <a href="https://www.livingsocial.com/cities/{city}/deals/{id}-deal-{id}">
+    <div class="deal-image"><img src="/images/{id}.jpg" alt=""></div>
+    <div class="deal-details">
+      <h2>
+        Deal {id} at Place {place}
+      </h2>
+      <h3>
+        {subtitle}
+      </h3>
+      <p class="description">
+        Two-course dinner for two w/ drinks at place {place}
+      </p>
+      <p class="location">
+        {location}
+      </p>
+    </div>
+    <div class="deal-prices">
+      <div class="deal-strikethrough-price">
+        <div class="strikethrough-wrapper"><sup>$</sup>{original_price}</div>
+      </div>
+      <div class="deal-price"><sup>$</sup>{price}</div>
+    </div>
+  </a>
+</li>'''
+
+
+def make_deal_page(deals, city='27-seattle', first_id=1, revision=0):
+    '''Returns the HTML of a city page w/ the given number of deals.
+    Bumping revision changes the deals' prices.'''
+    location = city.split('-', 1)[-1].replace('-', ' ').title()
+    items = [DEAL.format(id=deal_id, city=city, place=deal_id % 97,
+                         subtitle=u"Save {0}%".format(30 + deal_id % 50),
+                         location=location,
+                         original_price=40 + deal_id % 60,
+                         price=20 + (deal_id + revision) % 30)
+             for deal_id in range(first_id, first_id + deals)]
+    nav = u''.join(u'<li><a href="/cities/{0}">City {0}</a></li>'.format(i)
+                   for i in range(50))
+    return PAGE.format(city=location, nav=nav, deals=u'\n'.join(items))
+
+
+class FixtureServer(ThreadingHTTPServer):
+    '''Threaded HTTP server replaying synthetic city pages. City ids 1 to
+    pages each get deals deals, w/ links unique across cities. Other
+    paths (robots.txt included) are 404s.
+
+    Pages carry ETag and Last-Modified headers (unless validators is
+    False) and conditional requests get 304s. update() changes pages
+    between crawls.'''
+    daemon_threads = True
+
+    def __init__(self, address, pages=10, deals=50, latency=0.0,
+                 validators=True):
+        ThreadingHTTPServer.__init__(self, address, FixtureHandler)
+        self.pages = pages
+        self.deals = deals
+        self.latency = latency
+        self.validators = validators
+        self.revisions = [0] * (pages + 1)
+        self.started = time.time()
+        # Rendered pages by path and revision; building them shouldn't
+        # count as latency
+        self.cache = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.not_modified = 0
+
+    @property
+    def base_url(self):
+        '''Drop-in for the spider's base_url.'''
+        host, port = self.server_address[:2]
+        return 'http://{0}:{1}'.format(host, port)
+
+    def update(self, fraction):
+        '''Changes the deals on the first fraction of pages.'''
+        with self.lock:
+            for city_id in range(1, int(round(self.pages * fraction)) + 1):
+                self.revisions[city_id] += 1
+
+    def page(self, path):
+        '''Returns (body, etag, last modified) for path, or None if there
+        is no such page.'''
+        match = CITY_PATH.match(path)
+        if not match or not 1 <= int(match.group(1)) <= self.pages:
+            return None
+        city_id = int(match.group(1))
+        with self.lock:
+            revision = self.revisions[city_id]
+            key = (path, revision)
+            if key not in self.cache:
+                html = make_deal_page(self.deals, path.split('/')[-1],
+                                      first_id=(city_id - 1) * self.deals + 1,
+                                      revision=revision)
+                self.cache[key] = html.encode('utf-8')
+            body = self.cache[key]
+        etag = '"{0}-{1}"'.format(city_id, revision)
+        modified = formatdate(self.started + revision, usegmt=True)
+        return body, etag, modified
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    '''Serves city pages.'''
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+        if server.latency:
+            time.sleep(server.latency)
+        page = server.page(self.path.split('?')[0])
+        if page is None:
+            return self.send_body(404, b'')
+        body, etag, modified = page
+        if not server.validators:
+            return self.send_body(200, body)
+        if self.headers.get('If-None-Match') == etag or \
+                self.headers.get('If-Modified-Since') == modified:
+            with server.lock:
+                server.not_modified += 1
+            return self.send_body(304, b'', etag, modified)
+        self.send_body(200, body, etag, modified)
+
+    def send_body(self, status, body, etag=None, modified=None):
+        self.send_response(status)
+        if etag is not None:
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', modified)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Keep benchmark output readable
+        pass
+
+
+def start_fixture_server(host='127.0.0.1', port=0, **config):
+    '''Starts a FixtureServer in a background thread. port=0 picks a free
+    port; read it back from server.base_url. Stop w/ server.shutdown().'''
+    server = FixtureServer((host, port), **config)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    page = commands.add_parser('page', help='Write one city page to a file')
+    page.add_argument('outfile', help='HTML file to write')
+    page.add_argument('--deals', type=int, default=1000)
+    page.add_argument('--city', default='27-seattle')
+    serve = commands.add_parser('serve', help='Serve city pages over HTTP')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8000)
+    serve.add_argument('--pages', type=int, default=10,
+                       help='Number of city pages (ids 1 to pages)')
+    serve.add_argument('--deals', type=int, default=50,
+                       help='Deals per page')
+    serve.add_argument('--latency', type=float, default=0.0,
+                       help='Seconds to wait before answering each request')
+    serve.add_argument('--no-validators', dest='validators',
+                       action='store_false',
+                       help='Send no ETag/Last-Modified, ignore conditionals')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    opts = parse_args()
+    if opts.command == 'page':
+        with open(opts.outfile, 'w') as out:
+            out.write(make_deal_page(opts.deals, opts.city))
+    else:
+        server = FixtureServer((opts.host, opts.port), pages=opts.pages,
+                               deals=opts.deals, latency=opts.latency,
+                               validators=opts.validators)
+        print("Serving {0} city pages at {1}".format(opts.pages,
+                                                     server.base_url))
+        server.serve_forever()
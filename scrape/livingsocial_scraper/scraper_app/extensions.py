@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+# Define your extensions here
+#
+# Don't forget to add your extension to the EXTENSIONS setting
+# See: http://doc.scrapy.org/en/latest/topics/extensions.html
+
+import json
+import logging
+import time
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(values, fraction):
+    '''Nearest-rank percentile of a sorted list.'''
+    if not values:
+        return None
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+class CrawlStatsReport(object):
+    '''Reports crawl throughput when the spider closes: pages/sec,
+    items/sec and download latency percentiles, to the log, the crawl
+    stats and (w/ CRAWL_REPORT_FILE) a JSON file. Used to size runs
+    across many cities.'''
+
+    def __init__(self, stats, report_file=None):
+        self.stats = stats
+        self.report_file = report_file
+        self.latencies = []
+        self.pages = 0
+        self.items = 0
+        self.started = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('CRAWL_REPORT_ENABLED', True):
+            raise NotConfigured
+        ext = cls(crawler.stats, crawler.settings.get('CRAWL_REPORT_FILE'))
+        crawler.signals.connect(ext.spider_opened, signals.spider_opened)
+        crawler.signals.connect(ext.response_received,
+                                signals.response_received)
+        crawler.signals.connect(ext.item_scraped, signals.item_scraped)
+        crawler.signals.connect(ext.spider_closed, signals.spider_closed)
+        return ext
+
+    def spider_opened(self, spider):
+        self.started = time.time()
+
+    def response_received(self, response, request, spider):
+        self.pages += 1
+        latency = request.meta.get('download_latency')
+        if latency is not None:
+            self.latencies.append(latency)
+
+    def item_scraped(self, item, spider):
+        self.items += 1
+
+    def spider_closed(self, spider, reason):
+        report = self.report(time.time() - self.started)
+        for key, value in report.items():
+            self.stats.set_value('crawl_report/' + key, value)
+        logger.info("Crawl report: %(pages)d pages (%(pages_per_sec).1f/s), "
+                    "%(items)d items (%(items_per_sec).1f/s), latency "
+                    "p50 %(latency_p50)s p90 %(latency_p90)s "
+                    "p99 %(latency_p99)s", report)
+        if self.report_file:
+            with open(self.report_file, 'w') as out:
+                json.dump(report, out, indent=2)
+
+    def report(self, elapsed):
+        latencies = sorted(self.latencies)
+        elapsed = max(elapsed, 1e-9)
+        return {'elapsed': elapsed,
+                'pages': self.pages,
+                'items': self.items,
+                'pages_per_sec': self.pages / elapsed,
+                'items_per_sec': self.items / elapsed,
+                'latency_p50': percentile(latencies, 0.5),
+                'latency_p90': percentile(latencies, 0.9),
+                'latency_p99': percentile(latencies, 0.99)}
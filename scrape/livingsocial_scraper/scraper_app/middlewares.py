@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+# Define your downloader middlewares here
+#
+# Don't forget to add your middleware to the DOWNLOADER_MIDDLEWARES setting
+# See: http://scrapy.readthedocs.org/en/latest/topics/downloader-middleware.html
+
+import datetime
+import hashlib
+import logging
+
+from scrapy import signals
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+import livingsocial.models as models
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalCrawlMiddleware(object):
+    '''Skips pages that haven't changed since the last crawl. Each page's
+    ETag, Last-Modified and body hash are stored in the database; requests
+    for known pages are sent w/ If-None-Match/If-Modified-Since, and a 304,
+    or a 200 w/ the same body hash, is dropped before the spider parses it
+    (so the pipeline never sees its deals either).
+
+    Only city pages (requests w/ meta['city']) are tracked; robots.txt
+    and anything else pass through untouched.
+
+    Page state is read once when the spider opens and written in one batch
+    when it finishes, provided the pipeline stored every deal (it sets the
+    livingsocial/stored stat). Set INCREMENTAL_ENABLED = False, or pass
+    meta={'force': True}, to fetch pages regardless.'''
+
+    def __init__(self, engine, stats):
+        self.engine = engine
+        self.stats = stats
+        self.pages = {}
+        self.updates = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool('INCREMENTAL_ENABLED', True):
+            raise NotConfigured
+        mw = cls(models.db_connect(settings.get('DATABASE_URL')),
+                 crawler.stats)
+        crawler.signals.connect(mw.spider_opened, signals.spider_opened)
+        crawler.signals.connect(mw.spider_closed, signals.spider_closed)
+        return mw
+
+    def spider_opened(self, spider):
+        models.create_tables(self.engine)
+        with self.engine.connect() as connection:
+            self.pages = models.load_pages(connection)
+
+    def spider_closed(self, spider, reason):
+        # A crawl that stopped early, or whose deals didn't all reach the
+        # database, would skip those pages next time; remember nothing
+        if reason == 'finished' and self.updates:
+            if self.stats.get_value('livingsocial/stored', False):
+                with self.engine.begin() as connection:
+                    models.upsert_pages(connection,
+                                        list(self.updates.values()))
+            else:
+                logger.warning("Deals weren't all stored; not saving the "
+                               "state of %d pages", len(self.updates))
+        self.engine.dispose()
+
+    def process_request(self, request, spider):
+        if 'city' not in request.meta:
+            return None
+        page = self.pages.get(request.url)
+        if page is None or request.meta.get('force'):
+            return None
+        if page['etag']:
+            request.headers.setdefault('If-None-Match', page['etag'])
+        if page['last_modified']:
+            request.headers.setdefault('If-Modified-Since',
+                                       page['last_modified'])
+        return None
+
+    def process_response(self, request, response, spider):
+        if 'city' not in request.meta:
+            return response
+        if response.status == 304:
+            self.stats.inc_value('incremental/not_modified')
+            raise IgnoreRequest("Not modified: {0}".format(request.url))
+        if response.status != 200:
+            return response
+        digest = hashlib.sha1(response.body).hexdigest()
+        page = self.pages.get(request.url)
+        if page is not None and page['content_hash'] == digest and \
+                not request.meta.get('force'):
+            self.stats.inc_value('incremental/unchanged')
+            raise IgnoreRequest("Unchanged: {0}".format(request.url))
+        self.stats.inc_value('incremental/changed')
+        self.updates[request.url] = {
+            'url': request.url,
+            'etag': header(response, b'ETag'),
+            'last_modified': header(response, b'Last-Modified'),
+            'content_hash': digest,
+            'changed_at': datetime.datetime.utcnow()}
+        return response
+
+
+def header(response, name):
+    value = response.headers.get(name)
+    return value.decode('latin-1') if value is not None else None
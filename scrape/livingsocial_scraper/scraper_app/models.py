@@ -1,5 +1,6 @@
-from sqlalchemy import Column, DateTime, Integer, String, create_engine
-from sqlalchemy.engine.url import URL
+from sqlalchemy import (Column, DateTime, Integer, String, bindparam,
+                        create_engine, or_, select)
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.declarative import declarative_base
 
 import livingsocial.settings as settings
@@ -7,23 +8,96 @@ import livingsocial.settings as settings
 DeclarativeBase = declarative_base()
 
 
-def db_connect():
-    '''Connects with settings.py to Postgres. Returns sqlalchemy obj.'''
-    return create_engine(URL(**settings.DATABASE))
+def db_connect(url=None):
+    '''Connects to url, or DATABASE_URL from settings.py. Returns
+    sqlalchemy obj.'''
+    return create_engine(url or settings.DATABASE_URL)
 
 
 def create_tables(engine):
     DeclarativeBase.metadata.create_all(engine)
+    # create_all skips tables that exist, so deal tables from before link
+    # was the key never got the unique index upserts depend on
+    for index in Deal.__table__.indexes:
+        index.create(engine, checkfirst=True)
 
 
 class Deal(DeclarativeBase):
-    '''SQlalchemy Postgres livingsocial_deals model'''
+    '''SQlalchemy livingsocial_deals model'''
     __tablename__ = 'livingsocial_deals'
     id = Column(Integer, primary_key=True)
     title = Column('title', String)
     subtitle = Column('subtitle', String, nullable=True)
     description = Column('description', String, nullable=True)
-    link = Column('link', String, nullable=True)
+    # Natural key: re-crawls update a deal instead of inserting it again
+    link = Column('link', String, nullable=True, unique=True, index=True)
     location = Column('location', String, nullable=True)
+    # Prices are in cents
     original_price = Column('original_price', Integer, nullable=True)
     price = Column('price', Integer, nullable=True)
+
+
+DEAL_FIELDS = ['title', 'subtitle', 'description', 'link', 'location',
+               'original_price', 'price']
+UPSERT_DIALECTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+
+def upsert_deals(connection, rows):
+    '''Inserts deal rows (dicts), or updates the stored deal w/ the same
+    link. Rows must have unique links.'''
+    upsert(connection, Deal.__table__, 'link', DEAL_FIELDS, rows)
+
+
+def upsert(connection, table, key, fields, rows):
+    '''Inserts rows (dicts of fields) into table, or updates the stored
+    row w/ the same key column. On Postgres and SQLite unchanged rows are
+    left alone; other databases rewrite every existing row.'''
+    columns = [field for field in fields if field != key]
+    insert = UPSERT_DIALECTS.get(connection.dialect.name)
+    if insert is not None:
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c[key]],
+            set_={name: stmt.excluded[name] for name in columns},
+            where=or_(*[table.c[name].is_distinct_from(stmt.excluded[name])
+                        for name in columns]))
+        connection.execute(stmt, rows)
+        return
+    # Other databases: look up which keys exist, then insert/update
+    keys = [row[key] for row in rows]
+    existing = set(connection.execute(
+        select(table.c[key]).where(table.c[key].in_(keys))).scalars())
+    new = [row for row in rows if row[key] not in existing]
+    old = [dict(row, _key=row[key]) for row in rows if row[key] in existing]
+    if new:
+        connection.execute(table.insert(), new)
+    if old:
+        connection.execute(
+            table.update().where(table.c[key] == bindparam('_key'))
+            .values({name: bindparam(name) for name in columns}), old)
+
+
+class CrawledPage(DeclarativeBase):
+    '''Validators and content hash of a crawled page, for incremental
+    crawls.'''
+    __tablename__ = 'livingsocial_pages'
+    url = Column('url', String, primary_key=True)
+    etag = Column('etag', String, nullable=True)
+    last_modified = Column('last_modified', String, nullable=True)
+    content_hash = Column('content_hash', String, nullable=True)
+    changed_at = Column('changed_at', DateTime, nullable=True)
+
+
+PAGE_FIELDS = ['url', 'etag', 'last_modified', 'content_hash', 'changed_at']
+
+
+def load_pages(connection):
+    '''Returns stored page state as a dict of url -> row dict.'''
+    table = CrawledPage.__table__
+    return {row['url']: dict(row)
+            for row in connection.execute(select(table)).mappings()}
+
+
+def upsert_pages(connection, rows):
+    '''Stores page state rows (dicts w/ PAGE_FIELDS).'''
+    upsert(connection, CrawledPage.__table__, 'url', PAGE_FIELDS, rows)
@@ -5,28 +5,200 @@
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: http://doc.scrapy.org/en/latest/topics/item-pipeline.html
 
+import logging
+import queue
+import re
+import threading
+import time
+
+from scrapy.exceptions import DropItem
 from sqlalchemy.orm import sessionmaker
+from twisted.internet import defer, task, threads
 import livingsocial.models as models
 
+logger = logging.getLogger(__name__)
+
+PRICE_FIELDS = ['original_price', 'price']
+# "$1,299.99", "49", "$ 20" - optional currency sign, thousands separators
+# and cents
+PRICE = re.compile(r'^\s*[$\u20ac\xa3]?\s*(\d{1,3}(?:,\d{3})+|\d+)'
+                   r'(?:\.(\d{1,2}))?\s*$')
+
+
+def parse_price(value):
+    '''Returns price text as integer cents, None if empty. Numbers are
+    taken as cents already. Raises ValueError if value isn't a price.'''
+    if value is None or isinstance(value, int):
+        return value
+    if not value.strip():
+        return None
+    match = PRICE.match(value)
+    if match is None:
+        raise ValueError("Not a price: {0!r}".format(value))
+    dollars, cents = match.groups()
+    cents = int(cents.ljust(2, '0')) if cents else 0
+    return int(dollars.replace(',', '')) * 100 + cents
+
 
 class LivingSocialPipeline(object):
-    '''Pipeline for storing scraped items in database'''
-    def __init__(self):
+    '''Pipeline for storing scraped items in database. Items are buffered
+    and written w/ one bulk upsert (executemany) per batch: every
+    batch_size items, every flush_interval seconds, and on close. Deals
+    are keyed on link: repeats within a crawl are dropped unless their
+    content changed, and stored deals are only rewritten when changed.
+    Prices are parsed into integer cents first; deals w/ unparseable
+    prices are dropped and counted in the crawl stats, never sent to the
+    database.
+
+    Batches are written by a dedicated thread, so the reactor never waits
+    on the database. Up to queue_size batches can be waiting; past that,
+    process_item returns a Deferred that fires once there is room, which
+    holds Scrapy back instead of buffering without bound. Once every batch
+    is written, close_spider sets the livingsocial/stored stat, which
+    IncrementalCrawlMiddleware waits for before remembering pages.'''
+
+    def __init__(self, engine=None, batch_size=500, flush_interval=5.0,
+                 queue_size=4, stats=None):
         '''Inits db connection and sessionmaker. Creates deals table.'''
-        engine = models.db_connect()
-        models.create_tables(engine)
-        self.Session = sessionmaker(bind=engine)
+        self.engine = engine or models.db_connect()
+        self.stats = stats
+        self.rejected = 0
+        models.create_tables(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # pending rows by link, and a content hash of every link seen
+        self.buffer = {}
+        self.seen = {}
+        self.flushed_at = time.time()
+        self.flusher = None
+        # batches for the writer thread; the lock keeps blocked puts in order
+        self.queue = queue.Queue(queue_size)
+        self.put_lock = defer.DeferredLock()
+        self.error = None
+        self.writer = threading.Thread(target=self.write_batches,
+                                       name='LivingSocialPipeline writer')
+        self.writer.daemon = True
+        self.writer.start()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        '''Reads DATABASE_URL, DB_BATCH_SIZE, DB_FLUSH_INTERVAL and
+        DB_QUEUE_SIZE from settings.'''
+        settings = crawler.settings
+        return cls(engine=models.db_connect(settings.get('DATABASE_URL')),
+                   batch_size=settings.getint('DB_BATCH_SIZE', 500),
+                   flush_interval=settings.getfloat('DB_FLUSH_INTERVAL', 5.0),
+                   queue_size=settings.getint('DB_QUEUE_SIZE', 4),
+                   stats=crawler.stats)
+
+    def open_spider(self, spider):
+        '''Flushes on a timer too, so slow crawls still land in the db.'''
+        if self.flush_interval:
+            self.flusher = task.LoopingCall(self.flush_if_stale)
+            self.flusher.start(self.flush_interval, now=False)
+
+    def close_spider(self, spider):
+        '''Flushes what is left and waits for the writer to finish.'''
+        if self.flusher is not None and self.flusher.running:
+            self.flusher.stop()
+        d = defer.maybeDeferred(self.flush)
+        d.addCallback(lambda _: self.enqueue(None))
+        d.addCallback(lambda _: threads.deferToThread(self.writer.join))
+        d.addCallback(lambda _: self.check_writer())
+        d.addCallback(lambda _: self.stored())
+        return d
 
     def process_item(self, item, spider):
-        '''Save deal item in database. Called for every pipeline item.'''
+        '''Buffers deal item; flushes once the batch is full.'''
+        self.check_writer()
+        # Loaders leave out empty fields; bulk writes need every column
+        row = {field: item.get(field) for field in models.DEAL_FIELDS}
+        link = row['link']
+        if not link:
+            raise DropItem("Deal has no link: {0}".format(row['title']))
+        for field in PRICE_FIELDS:
+            try:
+                row[field] = parse_price(row[field])
+            except ValueError as exc:
+                self.reject(field)
+                raise DropItem("Deal {0} has bad {1}: {2}".format(
+                    link, field, exc))
+        digest = hash(tuple(row.values()))
+        if self.seen.get(link) == digest:
+            raise DropItem("Duplicate deal: {0}".format(link))
+        self.seen[link] = digest
+        self.buffer[link] = row
+        if len(self.buffer) >= self.batch_size:
+            d = self.flush()
+            if d is not None:
+                return d.addCallback(lambda _: item)
+        return item
+
+    def reject(self, field):
+        '''Counts a deal rejected for a bad field.'''
+        self.rejected += 1
+        if self.stats is not None:
+            self.stats.inc_value('livingsocial/rejected')
+            self.stats.inc_value('livingsocial/rejected/' + field)
+
+    def flush_if_stale(self):
+        if time.time() - self.flushed_at >= self.flush_interval:
+            return self.flush()
+
+    def flush(self):
+        '''Hands all buffered deals to the writer thread as one batch.
+        Returns a Deferred if the batch has to wait for room.'''
+        self.flushed_at = time.time()
+        if not self.buffer:
+            return None
+        rows, self.buffer = list(self.buffer.values()), {}
+        return self.enqueue(rows)
+
+    def enqueue(self, batch):
+        '''Queues batch w/o blocking the reactor: if the queue is full, the
+        put waits in a pool thread and a Deferred is returned.'''
+        if not self.put_lock.locked:
+            try:
+                self.queue.put_nowait(batch)
+                return None
+            except queue.Full:
+                pass
+        return self.put_lock.run(threads.deferToThread, self.queue.put, batch)
+
+    def write_batches(self):
+        '''Writer thread: upserts queued batches until it gets None.'''
+        while True:
+            rows = self.queue.get()
+            if rows is None:
+                return
+            # After a failure, drain the queue so producers don't block
+            if self.error is not None:
+                continue
+            try:
+                self.write(rows)
+            except Exception as exc:
+                logger.exception("Failed to write %d deals", len(rows))
+                self.error = exc
+
+    def write(self, rows):
+        '''Writes a batch of deals in a single transaction.'''
         session = self.Session()
-        deal = models.Deal(**item)
         try:
-            session.add(deal)
+            models.upsert_deals(session.connection(), rows)
             session.commit()
         except:
             session.rollback()
             raise
         finally:
             session.close()
-        return item
+
+    def stored(self):
+        '''Records that every deal made it to the database.'''
+        if self.stats is not None:
+            self.stats.set_value('livingsocial/stored', True)
+
+    def check_writer(self):
+        '''Re-raises a writer thread failure in the crawl.'''
+        if self.error is not None:
+            raise self.error
@@ -23,19 +23,26 @@ NEWSPIDER_MODULE = 'livingsocial.spiders'
 ROBOTSTXT_OBEY = True
 
 # Configure maximum concurrent requests performed by Scrapy (default: 16)
-# CONCURRENT_REQUESTS = 32
+# Sized for crawling hundreds of city pages in one run; AutoThrottle below
+# keeps what actually hits the site in check.
+CONCURRENT_REQUESTS = 64
 
 # Configure a delay for requests for the same website (default: 0)
 # http://scrapy.readthedocs.org/en/latest/topics/settings.html#download-delay
 # See also autothrottle settings and docs
 # DOWNLOAD_DELAY = 3
 # The download delay setting will honor only one of:
-# CONCURRENT_REQUESTS_PER_DOMAIN = 16
+CONCURRENT_REQUESTS_PER_DOMAIN = 16
 # CONCURRENT_REQUESTS_PER_IP = 16
 
 # Disable cookies (enabled by default)
 # COOKIES_ENABLED = False
 
+# Cache DNS lookups in memory; every request goes to the same host
+DNSCACHE_ENABLED = True
+DNSCACHE_SIZE = 10000
+DNS_TIMEOUT = 10
+
 # Disable Telnet Console (enabled by default)
 # TELNETCONSOLE_ENABLED = False
 
@@ -53,15 +60,25 @@ ROBOTSTXT_OBEY = True
 
 # Enable or disable downloader middlewares
 # See http://scrapy.readthedocs.org/en/latest/topics/downloader-middleware.html
-# DOWNLOADER_MIDDLEWARES = {
-#    'livingsocial.middlewares.MyCustomDownloaderMiddleware': 543,
-# }
+# Runs after HttpCompressionMiddleware (590) has decoded the body it hashes
+DOWNLOADER_MIDDLEWARES = {
+   'livingsocial.middlewares.IncrementalCrawlMiddleware': 580,
+}
+
+# IncrementalCrawlMiddleware sends conditional requests and skips pages
+# whose content hasn't changed since the last finished crawl
+INCREMENTAL_ENABLED = True
 
 # Enable or disable extensions
 # See http://scrapy.readthedocs.org/en/latest/topics/extensions.html
-# EXTENSIONS = {
-#    'scrapy.extensions.telnet.TelnetConsole': None,
-# }
+EXTENSIONS = {
+   'livingsocial.extensions.CrawlStatsReport': 500,
+}
+
+# CrawlStatsReport logs pages/sec, items/sec and latency percentiles when
+# the crawl ends; set a path to also get them as JSON
+CRAWL_REPORT_ENABLED = True
+CRAWL_REPORT_FILE = None
 
 # Configure item pipelines
 # See http://scrapy.readthedocs.org/en/latest/topics/item-pipeline.html
@@ -70,16 +87,24 @@ ITEM_PIPELINES = {
    'livingsocial.pipelines.LivingSocialPipeline': 100,
 }
 
+# LivingSocialPipeline buffers deals and bulk inserts them every
+# DB_BATCH_SIZE items or DB_FLUSH_INTERVAL seconds, whichever comes first.
+# Batches are written by a background thread; once DB_QUEUE_SIZE batches
+# are waiting, item processing is held back until the database catches up.
+DB_BATCH_SIZE = 500
+DB_FLUSH_INTERVAL = 5.0
+DB_QUEUE_SIZE = 4
+
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See http://doc.scrapy.org/en/latest/topics/autothrottle.html
-# AUTOTHROTTLE_ENABLED = True
+AUTOTHROTTLE_ENABLED = True
 # The initial download delay
-# AUTOTHROTTLE_START_DELAY = 5
+AUTOTHROTTLE_START_DELAY = 1
 # The maximum download delay to be set in case of high latencies
-# AUTOTHROTTLE_MAX_DELAY = 60
+AUTOTHROTTLE_MAX_DELAY = 30
 # The average number of requests Scrapy should be sending in parallel to
 # each remote server
-# AUTOTHROTTLE_TARGET_CONCURRENCY = 1.0
+AUTOTHROTTLE_TARGET_CONCURRENCY = 8.0
 # Enable showing throttling stats for every response received:
 # AUTOTHROTTLE_DEBUG = False
 
@@ -91,13 +116,8 @@ ITEM_PIPELINES = {
 # HTTPCACHE_IGNORE_HTTP_CODES = []
 # HTTPCACHE_STORAGE = 'scrapy.extensions.httpcache.FilesystemCacheStorage'
 
-# Configure Postgres Database location
-
-DATABASE = {
-    'drivername': 'postgres',
-    'host': 'localhost',
-    'port': '5432',
-    'username': os.getlogin(),
-    'password': '',
-    'database': 'scrape'
-}
+# Configure Database location
+# Any SQLAlchemy URL, e.g. postgresql://user@localhost:5432/scrape. Defaults
+# to a local SQLite file so the project runs w/o a database server.
+DATABASE_URL = os.environ.get('LIVINGSOCIAL_DATABASE_URL',
+                              'sqlite:///livingsocial.db')
@@ -1,34 +1,101 @@
+import re
+from urllib.parse import urlparse
+
 from livingsocial.items import LivingSocialDeal
-from scrapy.loader import ItemLoader
-from scrapy.loader.processors import Join, MapCompose
+from lxml import etree
 from scrapy.selector import Selector
-from scrapy.http import HtmlResponse
+from scrapy.http import Request
 from scrapy.spiders import Spider
 
+BASE_URL = "https://www.livingsocial.com"
+CITY_URL = "{0}/cities/{1}"
+CITY_RANGE = re.compile(r'^(\d+)-(\d+)$')
+
 
 class LivingSocialSpider(Spider):
-    '''Spider for up-to-date livingsocial.com site, Seattle page.'''
+    '''Spider for up-to-date livingsocial.com site. Crawls the Seattle page
+    unless given other cities, e.g.
+        scrapy crawl livingsocial -a cities=27-seattle,1-washington-dc
+        scrapy crawl livingsocial -a cities=1-300
+    Each entry is a city path (id w/ optional slug), or a range of ids.
+    base_url points the crawl at another host, e.g. the fixture server.'''
     name = 'livingsocial'
     allowed_domains = ["livingsocial.com"]
-    start_urls = ["https://www.livingsocial.com/cities/27-seattle"]
-    deals_list_xpath = '//li[@dealid]'
-    item_fields = {
-        'title': './/a/div[@class="deal-details"]/h2/text()',
-        'subtitle': './/a/div[@class="deal-details"]/h3/text()',
-        'description': './/a/div[@class="deal-details"]/p[@class="description"]/text()',
-        'link': './/a/@href',
-        'location': './/a/div[@class="deal-details"]/p[@class="location"]/text()',
-        'original_price': './/a/div[@class="deal-prices"]/div[@class="deal-strikethrough-price"]/div[@class="strikethrough-wrapper"]/sup/following-sibling::text()',
-        'price': './/a/div[@class="deal-prices"]/div[@class="deal-price"]/text()'
+    cities = "27-seattle"
+    base_url = BASE_URL
+    # XPaths are compiled once. Each deal's details and prices blocks are
+    # found once, and the fields are read relative to them.
+    deals_list_xpath = etree.XPath('//li[@dealid]')
+    link_xpath = etree.XPath('.//a/@href')
+    subtree_xpaths = {
+        'details': etree.XPath('.//a/div[@class="deal-details"]'),
+        'prices': etree.XPath('.//a/div[@class="deal-prices"]'),
     }
+    item_fields = [
+        ('title', 'details', etree.XPath('h2/text()')),
+        ('subtitle', 'details', etree.XPath('h3/text()')),
+        ('description', 'details',
+         etree.XPath('p[@class="description"]/text()')),
+        ('location', 'details', etree.XPath('p[@class="location"]/text()')),
+        ('original_price', 'prices',
+         etree.XPath('div[@class="deal-strikethrough-price"]'
+                     '/div[@class="strikethrough-wrapper"]'
+                     '/sup/following-sibling::text()')),
+        ('price', 'prices', etree.XPath('div[@class="deal-price"]/text()')),
+    ]
+
+    def __init__(self, *args, **kwargs):
+        super(LivingSocialSpider, self).__init__(*args, **kwargs)
+        self.base_url = self.base_url.rstrip('/')
+        if self.base_url != BASE_URL:
+            self.allowed_domains = [urlparse(self.base_url).hostname]
+
+    async def start(self):
+        # Scrapy 2.13+ entry point; older versions call start_requests
+        for request in self.start_requests():
+            yield request
+
+    def start_requests(self):
+        for city in parse_cities(self.cities):
+            yield Request(CITY_URL.format(self.base_url, city),
+                          meta={'city': city})
 
     def parse(self, response):
         '''Default Scrapy callback to process downloaded responses.'''
-        selector = Selector(response=response)
-        for deal in selector.xpath(self.deals_list_xpath):
-            loader = ItemLoader(LivingSocialDeal(), deal)
-            loader.default_input_processor = MapCompose(str.strip)
-            loader.default_output_processor = Join()
-            for field, xpath in self.item_fields.items():
-                loader.add_xpath(field, xpath)
-            yield loader.load_item()
+        root = Selector(response=response).root
+        for deal in self.deals_list_xpath(root):
+            yield self.extract_deal(deal)
+
+    def extract_deal(self, deal):
+        '''Builds a deal item from an li[@dealid] element. Text is
+        stripped and joined w/ spaces, as the old ItemLoader setup did.'''
+        subtrees = {name: xpath(deal)
+                    for name, xpath in self.subtree_xpaths.items()}
+        item = LivingSocialDeal()
+        item['link'] = join_stripped(self.link_xpath(deal))
+        for field, subtree, xpath in self.item_fields:
+            texts = []
+            for node in subtrees[subtree]:
+                texts.extend(xpath(node))
+            item[field] = join_stripped(texts)
+        return item
+
+
+def join_stripped(texts):
+    return u' '.join(text.strip() for text in texts)
+
+
+def parse_cities(cities):
+    '''Expands a comma separated string (or list) of city paths and id
+    ranges.'''
+    if isinstance(cities, str):
+        cities = cities.split(',')
+    for city in cities:
+        city = city.strip()
+        id_range = CITY_RANGE.match(city)
+        if id_range:
+            first, last = int(id_range.group(1)), int(id_range.group(2))
+            for city_id in range(first, last + 1):
+                yield str(city_id)
+        elif city:
+            yield city